@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+from mock_server import MockConfig, add_config_args, start_server
+
+# Drives main.py end to end against the local mock server and reports, per
+# configuration, items/sec, p50/p95 per-item latency, CPU and peak memory.
+# Fixed start-up cost (imports, dataset load) is measured once with an empty
+# index range and subtracted from the throughput.
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = {
+    "sequential": {"args": []},
+    "streaming": {"args": ["--stream"]},
+    "concurrent": {"args": ["--concurrency", "16"]},
+    "concurrent_stream": {"args": ["--concurrency", "16", "--stream"]},
+    "multi_key": {"args": ["--concurrency", "4"], "keys": 4},
+    "rate_limited": {"args": ["--concurrency", "16"], "server": {"error_429": 0.1, "retry_after": 0.5}},
+    "server_errors": {"args": ["--concurrency", "16"], "server": {"error_5xx": 0.05}},
+}
+
+def run_main(url, workdir, extra_args, items, keys=1, start=0):
+    key_names = [f"BENCH_KEY_{i}" for i in range(keys)]
+    env = dict(os.environ, **{name: "mock" for name in key_names})
+    cmd = [
+        sys.executable, os.path.join(REPO, "main.py"),
+        "--provider", "nvidia", "--model", "mock-model", "--base_url", url,
+        "--api_key", *key_names, "--folder", "bench", "--shard_id", "0",
+        "--start", str(start), "--end", str(start + items), *extra_args,
+    ]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - started
+    if status != 0:
+        raise RuntimeError(f"❌ main.py failed ({' '.join(extra_args)}):\n{stderr.decode(errors='replace')[-2000:]}")
+    return wall, usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024
+
+def read_latencies(workdir):
+    path = os.path.join(workdir, "temp", "bench", "standard_shard0.json")
+    with open(path, "r", encoding="utf-8") as f:
+        return np.array([json.loads(line)["time_usage"] for line in f])
+
+def run_config(name, spec, args, setup_time):
+    server_kwargs = {
+        "ttft": args.ttft, "tokens_per_sec": args.tokens_per_sec, "response_tokens": args.response_tokens,
+        "chunk_tokens": args.chunk_tokens, "error_429": args.error_429, "error_5xx": args.error_5xx,
+        "retry_after": args.retry_after, "seed": args.seed,
+    }
+    server_kwargs.update(spec.get("server", {}))
+    config = MockConfig(**server_kwargs)
+    server = start_server(config)
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as workdir:
+            wall, cpu, rss_mb = run_main(f"http://127.0.0.1:{server.server_port}/v1", workdir,
+                                         spec["args"], args.items, spec.get("keys", 1))
+            latencies = read_latencies(workdir)
+    finally:
+        server.shutdown()
+    busy = max(wall - setup_time, 1e-9)
+    return {
+        "config": name,
+        "items": int(len(latencies)),
+        "wall_s": round(wall, 2),
+        "items_per_sec": round(len(latencies) / busy, 2),
+        "p50_s": round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+        "p95_s": round(float(np.percentile(latencies, 95)), 3) if len(latencies) else None,
+        "cpu_s": round(cpu, 2),
+        "cpu_pct": round(100 * cpu / wall, 1),
+        "max_rss_mb": round(rss_mb, 1),
+        "server": config.counts,
+    }
+
+def compare(results, baseline_path, tolerance):
+    # Flags configurations whose throughput dropped or p95 rose by more than `tolerance`
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["config"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get(r["config"])
+        if not base:
+            continue
+        if r["items_per_sec"] < base["items_per_sec"] * (1 - tolerance):
+            regressions.append(f"{r['config']}: items/sec {base['items_per_sec']} → {r['items_per_sec']}")
+        if base["p95_s"] and r["p95_s"] and r["p95_s"] > base["p95_s"] * (1 + tolerance):
+            regressions.append(f"{r['config']}: p95 {base['p95_s']}s → {r['p95_s']}s")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the inference runner against a local mock LLM server.")
+    parser.add_argument("--configs", type=str, nargs="*", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--items", type=int, default=200, help="Dataset indices per configuration")
+    parser.add_argument("--output", type=str, help="Write results as JSON here (e.g. benchmarks/results.json)")
+    parser.add_argument("--baseline", type=str, help="Earlier --output file to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before flagging")
+    add_config_args(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_setup_") as workdir:
+        server = start_server(MockConfig())
+        setup_time, _, setup_rss = run_main(f"http://127.0.0.1:{server.server_port}/v1", workdir, [], 0)
+        server.shutdown()
+    print(f"⏱️ Start-up (imports + dataset load): {setup_time:.2f}s, {setup_rss:.0f} MB")
+
+    results = []
+    for name in args.configs:
+        result = run_config(name, CONFIGS[name], args, setup_time)
+        results.append(result)
+        print(f"📏 {name:18s} {result['items_per_sec']:8.2f} items/s  p50 {result['p50_s']}s  p95 {result['p95_s']}s  "
+              f"cpu {result['cpu_s']}s ({result['cpu_pct']}%)  rss {result['max_rss_mb']} MB  server {result['server']}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"items": args.items, "setup_s": round(setup_time, 2), "results": results}, f, indent=2)
+        print(f"💾 Results → {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"⚠️ Regression: {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against baseline")
@@ -0,0 +1,63 @@
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+import time
+import numpy as np
+
+# Start-up cost of the CLI: wall time of `main.py --help` (argument parsing only)
+# and of a run that fails argument validation, plus the slowest imports reported
+# by `python -X importtime`. Provider SDKs and `datasets` should not show up.
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "help": ["--help"],
+    "bad_args": ["--provider", "nvidia"],  # missing --shard_id: argparse exits with an error
+}
+
+def time_command(cmd, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run(cmd, cwd=REPO, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - started)
+    return times
+
+def slowest_imports(top):
+    # Top-level modules by cumulative import time (microseconds -> seconds)
+    proc = subprocess.run([sys.executable, "-X", "importtime", os.path.join(REPO, "main.py"), "--help"],
+                          cwd=REPO, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S.*)$", line)
+        if match:  # nested imports are indented, so only direct imports of main.py match
+            imports.append((match.group(2), int(match.group(1)) / 1e6))
+    return sorted(imports, key=lambda x: -x[1])[:top]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure main.py start-up and import time.")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--output", type=str, help="Write results as JSON here")
+    args = parser.parse_args()
+
+    # Bare interpreter start-up as the floor
+    commands = {"python": [sys.executable, "-c", "pass"]}
+    commands.update({name: [sys.executable, os.path.join(REPO, "main.py"), *cmd] for name, cmd in COMMANDS.items()})
+    results = {}
+    for name, cmd in commands.items():
+        times = time_command(cmd, args.repeats)
+        results[name] = round(float(np.median(times)), 3)
+        print(f"⏱️ {name:10s} median {results[name]:.3f}s (min {min(times):.3f}s)")
+
+    results["imports"] = slowest_imports(args.top)
+    for module, seconds in results["imports"]:
+        print(f"   {module:30s} {seconds * 1000:8.1f} ms")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results → {args.output}")
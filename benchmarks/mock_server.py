@@ -0,0 +1,166 @@
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI/Together/NVIDIA chat completions endpoint, so the
+# runner can be benchmarked without API credit. Accepts any key and model.
+#
+# Distributions are given as "0.5" (constant), "uniform:LOW,HIGH" or
+# "lognormal:MEDIAN,SIGMA" (seconds, or tokens for --response_tokens).
+
+def parse_distribution(spec):
+    if ":" not in str(spec):
+        value = float(spec)
+        return lambda rng: value
+    kind, params = spec.split(":", 1)
+    a, b = map(float, params.split(","))
+    if kind == "uniform":
+        return lambda rng: rng.uniform(a, b)
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(a), b)
+    raise ValueError(f"❌ Unknown distribution: {spec}")
+
+class MockConfig:
+    def __init__(self, ttft="0.2", tokens_per_sec=200.0, response_tokens="lognormal:400,0.5",
+                 chunk_tokens=4, error_429=0.0, error_5xx=0.0, retry_after=1.0, seed=0):
+        self.ttft = parse_distribution(ttft)
+        self.tokens_per_sec = tokens_per_sec
+        self.response_tokens = parse_distribution(response_tokens)
+        self.chunk_tokens = chunk_tokens
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "429": 0, "5xx": 0}
+
+    def draw(self):
+        # (outcome, ttft, response token count, answer letter) for one request, reproducible per seed
+        with self.lock:
+            self.counts["requests"] += 1
+            roll = self.rng.random()
+            if roll < self.error_429:
+                outcome = "429"
+            elif roll < self.error_429 + self.error_5xx:
+                outcome = "5xx"
+            else:
+                outcome = "ok"
+            self.counts[outcome] += 1
+            return outcome, max(0.0, self.ttft(self.rng)), max(1, int(self.response_tokens(self.rng))), self.rng.choice("abcd")
+
+def response_words(n_tokens, letter):
+    # Reasoning-shaped text: a think block, the answer line, then a little trailing text
+    think = ["wait" if i % 50 == 49 else "hmm" for i in range(max(0, n_tokens - 12))]
+    return ["<think>"] + think + ["</think>", "The", "answer", "is", f"({letter}).", "That", "is", "all."]
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_chunk(self, payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+                return
+            outcome, ttft, n_tokens, letter = config.draw()
+            if outcome == "429":
+                self.send_json(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+                               {"Retry-After": str(config.retry_after)})
+                return
+            if outcome == "5xx":
+                self.send_json(503, {"error": {"message": "Service unavailable", "type": "server_error"}})
+                return
+
+            words = response_words(n_tokens, letter)
+            usage = {"prompt_tokens": len(str(body.get("messages", ""))) // 4, "completion_tokens": len(words)}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            base = {"id": "mock", "created": int(time.time()), "model": body.get("model", "mock")}
+            time.sleep(ttft)
+
+            if not body.get("stream"):
+                time.sleep(len(words) / config.tokens_per_sec)
+                self.send_json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                }]))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                step = config.chunk_tokens
+                for i in range(0, len(words), step):
+                    if i:
+                        time.sleep(step / config.tokens_per_sec)
+                    delta = " ".join(words[i:i + step]) + " "
+                    self.send_chunk(json.dumps(dict(base, object="chat.completion.chunk", choices=[
+                        {"index": 0, "delta": {"content": delta}, "finish_reason": None}])))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self.send_chunk(json.dumps(dict(base, object="chat.completion.chunk", choices=[], usage=usage)))
+                self.send_chunk("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # client stopped reading (e.g. --early_stop)
+
+    return Handler
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # the default backlog of 5 stalls bursts of new connections
+
+def start_server(config, port=0, host="127.0.0.1"):
+    server = MockServer((host, port), make_handler(config))
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+def add_config_args(parser):
+    parser.add_argument("--ttft", type=str, default="0.2", help="Time to first token (distribution, seconds)")
+    parser.add_argument("--tokens_per_sec", type=float, default=200.0, help="Generation speed of each response")
+    parser.add_argument("--response_tokens", type=str, default="lognormal:400,0.5", help="Response length (distribution, tokens)")
+    parser.add_argument("--chunk_tokens", type=int, default=4, help="Tokens per streamed chunk")
+    parser.add_argument("--error_429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--error_5xx", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--retry_after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=0)
+
+def config_from_args(args):
+    return MockConfig(args.ttft, args.tokens_per_sec, args.response_tokens, args.chunk_tokens,
+                      args.error_429, args.error_5xx, args.retry_after, args.seed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server.")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_args(parser)
+    args = parser.parse_args()
+
+    server = start_server(config_from_args(args), args.port)
+    print(f"🧪 Mock LLM server at http://127.0.0.1:{server.server_port}/v1 (Ctrl-C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
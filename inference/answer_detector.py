@@ -0,0 +1,72 @@
+# answer_detector.py
+from time import time as timer
+from inference.answer_extractor import STRICT_PATTERN as ANSWER_PATTERN, THINK_END
+# Rescan this many characters before the new delta, so a match split across deltas is found
+OVERLAP = 64
+
+class AnswerDetector:
+    # Incremental scan of a streamed response. The answer counts as final only once
+    # it appears after </think>: answers tried inside the reasoning are ignored.
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+        self.tail = ""
+        self.after_think = False
+        self.answer = None
+
+    def feed(self, delta):
+        self.parts.append(delta)
+        self.length += len(delta)
+        window = self.tail + delta
+        if not self.after_think:
+            pos = window.find(THINK_END)
+            if pos < 0:
+                self.tail = window[-OVERLAP:]
+                return False
+            self.after_think = True
+            window = window[pos + len(THINK_END):]
+        match = ANSWER_PATTERN.search(window)
+        if match:
+            self.answer = match.group(1)
+            return True
+        self.tail = window[-OVERLAP:]
+        return False
+
+    def text(self):
+        return "".join(self.parts)
+
+class StreamMonitor:
+    # Per-request stream timings: time to first token and time until the final
+    # answer was seen. With early_stop, tells the caller to close the stream there.
+    # `usage` and `finish_reason` are filled from the chunks when the provider reports them.
+    def __init__(self, start_time, early_stop=False):
+        self.start_time = start_time
+        self.early_stop = early_stop
+        self.detector = AnswerDetector()
+        self.usage = None
+        self.finish_reason = None
+        self.ttft = None
+        self.time_to_answer = None
+        self.stopped_early = False
+
+    def feed(self, delta):
+        # Returns True when the stream should be closed
+        if self.ttft is None:
+            self.ttft = timer() - self.start_time
+        if self.time_to_answer is None and self.detector.feed(delta):
+            self.time_to_answer = timer() - self.start_time
+            self.stopped_early = self.early_stop
+            return self.early_stop
+        if self.time_to_answer is not None:
+            self.detector.parts.append(delta)
+        return False
+
+    def text(self):
+        return self.detector.text()
+
+    def timing(self):
+        return {
+            "ttft": round(self.ttft, 3) if self.ttft is not None else None,
+            "time_to_answer": round(self.time_to_answer, 3) if self.time_to_answer is not None else None,
+            "stopped_early": self.stopped_early,
+        }
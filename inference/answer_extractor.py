@@ -0,0 +1,52 @@
+# answer_extractor.py
+import re
+
+# The format every prompt asks for; tried first, after </think> and then on the whole text
+STRICT_PATTERN = re.compile(r"The answer is\s*\((\w)\)")
+THINK_START, THINK_END = "<think>", "</think>"
+# Fallbacks for near-misses of that format, tried in order on the text after
+# </think> only (if there is a think block), so letters mentioned while
+# reasoning are never picked up
+# A choice letter: "(c)", a capital "C" closed by punctuation, ")", "*" or the
+# line end, or "c." / "c)" (a letter running into text is a word: "A bit unclear")
+CHOICE = r"(?:\(([A-Za-z])\)|\b([A-Z])(?=[.,;:!?)*]|[ \t]*(?:\n|$))|\b([a-z])[.)](?!\w))"
+TOLERANT_PATTERNS = [
+    ("answer_is", re.compile(r"(?i:answer is)[\s*:]*" + CHOICE)),
+    ("answer_label", re.compile(r"\b(?i:answer)[\s*]*:[\s*]*" + CHOICE)),
+    ("bold_choice", re.compile(r"\*\*\s*" + CHOICE)),
+]
+CHOICE_PATTERN = re.compile(r"\(([a-z])\)", re.IGNORECASE)
+# Only the last few hundred characters count for the last-choice heuristic
+LAST_CHOICE_WINDOW = 300
+
+def letter_index(letter):
+    return ord(letter.lower()) - ord("a")
+
+def extract_answer(text, num_choices=4):
+    # -> (choice index, extraction method), or (None, None)
+    if text is None:
+        return None, None
+    # The first strict answer after </think> wins, the one AnswerDetector stops the
+    # stream at; answers tried while reasoning only count when there is none after
+    pos = text.find(THINK_END)
+    match = (pos >= 0 and STRICT_PATTERN.search(text, pos + len(THINK_END))) or STRICT_PATTERN.search(text)
+    if match:
+        return letter_index(match.group(1)), "strict"
+
+    pos = text.rfind(THINK_END)
+    if pos >= 0:
+        final = text[pos + len(THINK_END):]
+    elif THINK_START in text:
+        # Still reasoning (e.g. truncated): no final answer to salvage
+        return None, None
+    else:
+        final = text  # no reasoning block at all
+    for method, pattern in TOLERANT_PATTERNS:
+        for match in pattern.finditer(final):
+            idx = letter_index(next(g for g in match.groups() if g))
+            if idx < num_choices:
+                return idx, method
+    choices = [m for m in CHOICE_PATTERN.findall(final[-LAST_CHOICE_WINDOW:]) if letter_index(m) < num_choices]
+    if choices:
+        return letter_index(choices[-1]), "last_choice"
+    return None, None
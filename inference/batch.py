@@ -0,0 +1,216 @@
+# batch.py
+import json
+import os
+import shutil
+import time
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+GEMINI_STATES = {
+    "JOB_STATE_SUCCEEDED": "completed",
+    "JOB_STATE_PARTIALLY_SUCCEEDED": "completed",
+    "JOB_STATE_FAILED": "failed",
+    "JOB_STATE_EXPIRED": "expired",
+    "JOB_STATE_CANCELLED": "cancelled",
+}
+
+def custom_id(idx):
+    return f"idx-{idx}"
+
+def parse_custom_id(value):
+    return int(str(value).split("-", 1)[1])
+
+def write_jsonl(path, lines):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+def read_jsonl_text(text):
+    for line in text.splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+def chat_usage(usage):
+    if not usage:
+        return {"prompt": -1, "completion": -1, "total": -1}
+    return {"prompt": usage.get("prompt_tokens", -1), "completion": usage.get("completion_tokens", -1), "total": usage.get("total_tokens", -1)}
+
+def parse_openai_output_line(line):
+    # -> (idx, response_text, token_usage, error) from one OpenAI-format batch output/error line
+    idx = parse_custom_id(line["custom_id"])
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if line.get("error") or response.get("status_code", 200) != 200 or not body.get("choices"):
+        return idx, None, chat_usage(None), line.get("error") or body.get("error") or f"status {response.get('status_code')}"
+    return idx, body["choices"][0]["message"]["content"], chat_usage(body.get("usage")), None
+
+# ====== Backends ======
+# Each backend turns prompts into its input-file lines, submits the file, reports
+# a normalised state (validating/in_progress/completed/failed/expired/cancelled)
+# and yields (idx, response_text, token_usage, error) per request once done.
+
+class OpenAIBatchBackend:
+    # OpenAI-compatible batch API: Together (together SDK) and NVIDIA (openai SDK)
+    def __init__(self, client, provider, model, params):
+        self.client = client
+        self.provider = provider
+        self.model = model
+        self.params = params
+
+    def format_line(self, idx, prompt):
+        return {
+            "custom_id": custom_id(idx),
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {"model": self.model, "messages": [{"role": "user", "content": prompt}], **self.params},
+        }
+
+    def submit(self, input_path):
+        if self.provider == "together":
+            uploaded = self.client.files.upload(file=input_path, purpose="batch-api")
+            return self.client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT).job.id
+        with open(input_path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        return self.client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window="24h").id
+
+    def status(self, batch_id):
+        job = self.client.batches.retrieve(batch_id)
+        self.job = job
+        return (job.status or "validating").lower()
+
+    def _file_text(self, file_id):
+        content = self.client.files.content(file_id)
+        return content.text if hasattr(content, "text") else content.read().decode("utf-8")
+
+    def results(self, batch_id):
+        job = self.client.batches.retrieve(batch_id)
+        for file_id in (job.output_file_id, job.error_file_id):
+            if file_id:
+                for line in read_jsonl_text(self._file_text(file_id)):
+                    yield parse_openai_output_line(line)
+
+class GeminiBatchBackend:
+    # Gemini Batch API through google-genai, with a JSONL file of keyed requests
+    def __init__(self, client, model, params=None):
+        self.client = client
+        self.model = model
+        self.params = params or {}
+
+    def generation_config(self):
+        # Same sampling parameters as GeminiProvider.config, in the REST field names
+        config = {"temperature": self.params.get("temperature"), "maxOutputTokens": self.params.get("max_tokens")}
+        return {k: v for k, v in config.items() if v is not None}
+
+    def format_line(self, idx, prompt):
+        request = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if self.generation_config():
+            request["generationConfig"] = self.generation_config()
+        return {"key": custom_id(idx), "request": request}
+
+    def submit(self, input_path):
+        from google.genai import types
+        uploaded = self.client.files.upload(file=input_path, config=types.UploadFileConfig(
+            display_name=os.path.basename(input_path), mime_type="jsonl"))
+        return self.client.batches.create(model=self.model, src=uploaded.name).name
+
+    def status(self, batch_id):
+        state = self.client.batches.get(name=batch_id).state
+        name = getattr(state, "name", str(state))
+        return GEMINI_STATES.get(name, "in_progress")
+
+    def results(self, batch_id):
+        job = self.client.batches.get(name=batch_id)
+        text = self.client.files.download(file=job.dest.file_name).decode("utf-8")
+        for line in read_jsonl_text(text):
+            idx = parse_custom_id(line["key"])
+            response = line.get("response") or {}
+            candidates = response.get("candidates") or []
+            if line.get("error") or not candidates:
+                yield idx, None, chat_usage(None), line.get("error") or "no candidates"
+                continue
+            text_parts = [part.get("text", "") for part in candidates[0].get("content", {}).get("parts", [])]
+            meta = response.get("usageMetadata") or {}
+            usage = {"prompt": meta.get("promptTokenCount", -1), "completion": meta.get("candidatesTokenCount", -1), "total": meta.get("totalTokenCount", -1)}
+            yield idx, "".join(text_parts), usage, None
+
+class LocalBatchBackend:
+    # File-based stand-in for a batch service, for tests and dry runs. A batch is a
+    # folder under `root` with input.jsonl and, once done, output.jsonl in the
+    # OpenAI batch output format. With `client` (any OpenAI-compatible chat client,
+    # e.g. pointed at benchmarks/mock_server.py) the batch is answered on the first
+    # poll; without one, something else has to write output.jsonl.
+    def __init__(self, root, model, params, client=None):
+        self.root = root
+        self.model = model
+        self.params = params
+        self.client = client
+
+    def format_line(self, idx, prompt):
+        return OpenAIBatchBackend.format_line(self, idx, prompt)
+
+    def submit(self, input_path):
+        batch_id = f"local-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        folder = os.path.join(self.root, batch_id)
+        os.makedirs(folder, exist_ok=True)
+        shutil.copyfile(input_path, os.path.join(folder, "input.jsonl"))
+        return batch_id
+
+    def status(self, batch_id):
+        folder = os.path.join(self.root, batch_id)
+        if os.path.exists(os.path.join(folder, "output.jsonl")):
+            return "completed"
+        if self.client is None:
+            return "in_progress"
+        self._process(folder)
+        return "completed"
+
+    def _process(self, folder):
+        with open(os.path.join(folder, "input.jsonl"), "r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f]
+        lines = []
+        for request in requests:
+            try:
+                body = self.client.chat.completions.create(**request["body"]).model_dump()
+                lines.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None})
+            except Exception as e:
+                lines.append({"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}})
+        write_jsonl(os.path.join(folder, "output.jsonl"), lines)
+
+    def results(self, batch_id):
+        with open(os.path.join(self.root, batch_id, "output.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                yield parse_openai_output_line(json.loads(line))
+
+# ====== Job state ======
+# One file per shard output, so rerunning the same command resumes polling the
+# submitted batch instead of paying for it twice.
+def batch_state_path(batch_dir, output_file):
+    name = os.path.splitext(os.path.normpath(output_file))[0].replace(os.sep, "_")
+    return os.path.join(batch_dir, "jobs", f"{name}.json")
+
+def load_batch_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_batch_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def wait_for_batch(backend, batch_id, poll_interval):
+    last = None
+    while True:
+        state = backend.status(batch_id)
+        if state != last:
+            print(f"📦 Batch {batch_id}: {state}")
+            last = state
+        if state in TERMINAL_STATES:
+            return state
+        time.sleep(poll_interval)
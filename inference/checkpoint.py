@@ -0,0 +1,92 @@
+# checkpoint.py
+import json
+import os
+import struct
+import time
+
+# File layout: magic, byte size of the shard output covered by the bitmap, bit count, bitmap
+HEADER = struct.Struct("<4sQI")
+MAGIC = b"CKP1"
+
+def checkpoint_path(output_file):
+    return os.path.splitext(output_file)[0] + ".ckpt"
+
+class CompletionCheckpoint:
+    # Bitmap of finished dataset indices for one shard output file. It records how
+    # many bytes of the output it covers, so a resume only has to scan records
+    # appended after the last save instead of the whole file.
+    def __init__(self, path, save_every=50, save_interval=30.0):
+        self.path = path
+        self.bits = bytearray()
+        self.output_offset = 0
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.unsaved = 0
+        self.last_save = time.monotonic()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, "rb") as f:
+            magic, self.output_offset, nbits = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"❌ Not a checkpoint file: {self.path}")
+            self.bits = bytearray(f.read((nbits + 7) // 8))
+        return self
+
+    def catch_up(self, output_file):
+        # Mark indices written to `output_file` after the checkpoint was last saved
+        if not os.path.exists(output_file):
+            return 0
+        found = 0
+        with open(output_file, "rb") as f:
+            if self.output_offset > os.path.getsize(output_file):
+                self.output_offset = 0
+            f.seek(self.output_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn final record from a crash; it will be rerun
+                try:
+                    idx = json.loads(line).get("index")
+                except ValueError:
+                    continue
+                if idx is not None and not self.is_done(idx):
+                    self.mark(idx)
+                    found += 1
+            self.output_offset = f.tell()
+        return found
+
+    def mark(self, idx):
+        byte = idx >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(b"\x00" * (byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << (idx & 7)
+        self.unsaved += 1
+
+    def is_done(self, idx):
+        byte = idx >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (idx & 7)))
+
+    def count(self):
+        return sum(bin(b).count("1") for b in self.bits)
+
+    def snapshot(self):
+        # Freeze the current bitmap for a deferred save (see BatchWriter.sync)
+        self.unsaved = 0
+        self.last_save = time.monotonic()
+        return bytes(self.bits)
+
+    def save(self, output_offset, bits=None):
+        if bits is None:
+            bits = self.snapshot()
+        self.output_offset = output_offset
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, output_offset, len(bits) * 8))
+            f.write(bits)
+        os.replace(tmp_path, self.path)
+
+    def should_save(self):
+        return self.unsaved >= self.save_every or (
+            self.unsaved and time.monotonic() - self.last_save >= self.save_interval
+        )
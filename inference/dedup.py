@@ -0,0 +1,161 @@
+# dedup.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from glob import glob
+
+# Records written since the request key was added end with it, so a scan can
+# pick it (and the index) off each line without decoding the response text.
+# Older records carry no model and are never matched.
+REQUEST_KEY_PATTERN = re.compile(rb'"request_key": "([0-9a-f]+)"\}\s*$')
+INDEX_PATTERN = re.compile(rb'^\{"index": (-?\d+)[,}]')
+LOOKUP_CHUNK = 500
+
+def make_request_key(model, params, prompt):
+    # Same rendered prompt (prompt_map entry + question), model and every request
+    # setting that shapes the response (sampling params, max_tokens, early_stop), so
+    # an answer cut short by a smaller budget or early stop never stands in for a full one
+    payload = json.dumps([model, dict(sorted(params.items())), prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def result_files(roots):
+    # JSONL shard/combined outputs and Parquet files or parts under the result roots
+    for root in roots:
+        for path in glob(os.path.join(root, "**", "*.json"), recursive=True):
+            yield path
+        for path in glob(os.path.join(root, "**", "*.parquet"), recursive=True):
+            if os.path.isfile(path):
+                yield path
+
+class DedupIndex:
+    # Persistent request_key -> (file, byte offset or row) index over every result
+    # file under the roots (temp/ and output/ by default). JSONL files are
+    # append-only, so each refresh only scans the bytes written since the last
+    # one; a file that shrank or was replaced (new inode) is rescanned from the
+    # start. Parquet files and parts are immutable and scanned once.
+    def __init__(self, path="cache/dedup_index.sqlite"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                inode INTEGER,
+                size INTEGER,
+                mtime REAL,
+                offset INTEGER
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                key TEXT,
+                path TEXT,
+                position INTEGER,
+                idx INTEGER
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_records_key ON records(key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_records_path ON records(path)")
+        self.conn.commit()
+
+    def refresh(self, roots):
+        # Returns the number of newly indexed records
+        known = {row[0]: tuple(row[1:]) for row in self.conn.execute("SELECT path, inode, size, mtime, offset FROM files")}
+        seen, added = set(), 0
+        with self.conn:
+            for path in result_files(roots):
+                seen.add(path)
+                stat = os.stat(path)
+                previous = known.get(path)
+                parquet = path.endswith(".parquet")
+                if parquet:
+                    if previous and previous[:3] == (stat.st_ino, stat.st_size, stat.st_mtime):
+                        continue
+                    offset = 0
+                elif previous and previous[0] == stat.st_ino and previous[3] <= stat.st_size:
+                    offset = previous[3]
+                    if offset == stat.st_size:
+                        continue
+                else:
+                    offset = 0
+                if offset == 0:
+                    self._forget(path)
+                rows, offset = self._scan_parquet(path) if parquet else self._scan_jsonl(path, offset)
+                self.conn.executemany("INSERT INTO records (key, path, position, idx) VALUES (?, ?, ?, ?)", rows)
+                self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                  (path, stat.st_ino, stat.st_size, stat.st_mtime, offset))
+                added += len(rows)
+            for path in set(known) - seen:
+                self._forget(path)
+        return added
+
+    def _forget(self, path):
+        self.conn.execute("DELETE FROM records WHERE path = ?", (path,))
+        self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _scan_jsonl(self, path, offset):
+        # Complete lines from `offset` on; a trailing partial line waits for the next refresh
+        rows = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                match = REQUEST_KEY_PATTERN.search(line)
+                if match:
+                    idx = INDEX_PATTERN.match(line)
+                    rows.append((match.group(1).decode("ascii"), path, offset, int(idx.group(1)) if idx else None))
+                offset += len(line)
+        return rows, offset
+
+    def _scan_parquet(self, path):
+        import pyarrow.parquet as pq
+        if "request_key" not in pq.read_schema(path).names:
+            return [], 0
+        table = pq.read_table(path, columns=["index", "request_key"])
+        rows = [(key, path, row, idx) for row, (idx, key) in
+                enumerate(zip(table.column("index").to_pylist(), table.column("request_key").to_pylist())) if key]
+        return rows, 0
+
+    def lookup(self, keys):
+        # -> {request_key: (path, position)} for the keys already answered somewhere
+        keys, found = list(keys), {}
+        for i in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[i:i + LOOKUP_CHUNK]
+            query = f"SELECT key, path, position FROM records WHERE key IN ({','.join('?' * len(chunk))})"
+            for key, path, position in self.conn.execute(query, chunk):
+                found.setdefault(key, (path, position))
+        return found
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+def read_referenced(references):
+    # {key: (path, position)} -> {key: record}, opening each file once. A record
+    # whose own request_key differs (file rewritten since the last refresh) is dropped.
+    from utils.results_io import from_row
+    by_path = {}
+    for key, (path, position) in references.items():
+        by_path.setdefault(path, []).append((position, key))
+    records = {}
+    for path, wanted in by_path.items():
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            table = pq.read_table(path)
+            for position, key in wanted:
+                if position < table.num_rows:
+                    records[key] = from_row(table.slice(position, 1).to_pylist()[0])
+        else:
+            with open(path, "rb") as f:
+                for position, key in sorted(wanted):
+                    f.seek(position)
+                    try:
+                        records[key] = json.loads(f.readline())
+                    except ValueError:
+                        continue
+    return {key: record for key, record in records.items() if record.get("request_key") == key}
@@ -0,0 +1,53 @@
+# key_pool.py
+import os
+import re
+from dotenv import dotenv_values
+from inference.rate_limiter import error_status, is_rate_limit_error
+
+# Error fragments meaning the key itself is unusable (exhausted credit, revoked key).
+# Plain 429 rate limiting is transient and does not take a key out of rotation:
+# Gemini's per-minute 429 says "exceeded your current quota ... billing details"
+# and quotes quota numbers, so a 429 only counts with explicit credit exhaustion.
+CREDIT_ERROR_PATTERN = re.compile(
+    r"insufficient[_ ]quota|credit limit|insufficient (?:credit|balance|funds)|payment required",
+    re.IGNORECASE,
+)
+KEY_ERROR_PATTERN = re.compile(
+    r"invalid api key|incorrect api key|api key not valid|unauthorized|\b40[12]\b",
+    re.IGNORECASE,
+)
+
+def is_quota_error(error):
+    if not error:
+        return False
+    if error_status(error) in (401, 402) or CREDIT_ERROR_PATTERN.search(str(error)):
+        return True
+    return not is_rate_limit_error(error) and bool(KEY_ERROR_PATTERN.search(str(error)))
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+# Same `.env` scan as utils/check_api_keys.py, e.g. pattern r"together_\d+"
+def discover_keys(pattern, env_file=".env"):
+    regex = re.compile(pattern)
+    names = set(dotenv_values(env_file)) | set(os.environ)
+    return sorted((name for name in names if regex.fullmatch(name)), key=_natural_key)
+
+class KeyPool:
+    def __init__(self, key_names):
+        if not key_names:
+            raise ValueError("❌ No API keys given. Use --api_key or --key_pattern.")
+        self.keys = list(key_names)
+        self.retired = {}
+
+    def is_active(self, key_name):
+        return key_name not in self.retired
+
+    def retire(self, key_name, reason):
+        if key_name not in self.retired:
+            self.retired[key_name] = reason
+            print(f"🔑 Retiring {key_name}: {reason}")
+
+    @property
+    def active_keys(self):
+        return [k for k in self.keys if k not in self.retired]
@@ -0,0 +1,169 @@
+# metrics.py
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.95, 0.99)
+PREFIX = "mmlu_"
+
+class Summary:
+    # Count/sum over the whole run, quantiles over the most recent `max_samples`
+    def __init__(self, max_samples=10000):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: None for q in QUANTILES}
+        return {q: ordered[max(0, math.ceil(q * len(ordered)) - 1)] for q in QUANTILES}
+
+class MetricsRegistry:
+    # Process-wide summaries and counters, keyed by metric name + label set
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.summaries = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.summaries:
+                self.summaries[key] = Summary()
+            self.summaries[key].observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def bind(self, **labels):
+        return BoundMetrics(self, labels)
+
+    def snapshot(self):
+        with self.lock:
+            summaries = [
+                {"name": name, "labels": dict(labels), "count": s.count, "sum": round(s.sum, 6),
+                 **{f"p{int(q * 100)}": v for q, v in s.quantiles().items()}}
+                for (name, labels), s in self.summaries.items()
+            ]
+            counters = [{"name": name, "labels": dict(labels), "value": v} for (name, labels), v in self.counters.items()]
+        return {"time": time.time(), "uptime": round(time.time() - self.started, 3), "summaries": summaries, "counters": counters}
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = []
+        for kind, entries in (("summary", snapshot["summaries"]), ("counter", snapshot["counters"])):
+            for name in sorted({e["name"] for e in entries}):
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                for e in entries:
+                    if e["name"] != name:
+                        continue
+                    if kind == "counter":
+                        lines.append(f"{PREFIX}{name}{format_labels(e['labels'])} {e['value']}")
+                        continue
+                    for q in QUANTILES:
+                        value = e[f"p{int(q * 100)}"]
+                        if value is not None:
+                            lines.append(f"{PREFIX}{name}{format_labels(dict(e['labels'], quantile=q))} {value}")
+                    lines.append(f"{PREFIX}{name}_sum{format_labels(e['labels'])} {e['sum']}")
+                    lines.append(f"{PREFIX}{name}_count{format_labels(e['labels'])} {e['count']}")
+        return "\n".join(lines) + "\n"
+
+    def summary_lines(self, phases=("connect", "ttft", "total")):
+        # Short console report per key: p50/p95 of the main phases and of tokens/sec
+        rows = {}
+        for e in self.snapshot()["summaries"]:
+            phase = e["labels"].get("phase") if e["name"] == "phase_seconds" else e["name"]
+            if phase in phases or phase == "tokens_per_second":
+                rows.setdefault(e["labels"].get("key"), {})[phase] = e
+        lines = []
+        for key, entries in sorted(rows.items(), key=lambda r: str(r[0])):
+            parts = [f"{phase} p50={entries[phase]['p50']:.2f}s p95={entries[phase]['p95']:.2f}s" for phase in phases if phase in entries]
+            if "tokens_per_second" in entries:
+                parts.append(f"tok/s p50={entries['tokens_per_second']['p50']:.1f}")
+            lines.append(f"{key}: " + ", ".join(parts))
+        return lines
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+class BoundMetrics:
+    # Registry view with fixed labels (key/provider/model) for one worker
+    def __init__(self, registry, labels):
+        self.registry = registry
+        self.labels = labels
+
+    def phase(self, phase, seconds):
+        self.registry.observe("phase_seconds", seconds, phase=phase, **self.labels)
+
+    def observe(self, name, value, **labels):
+        self.registry.observe(name, value, **self.labels, **labels)
+
+    def inc(self, name, value=1, **labels):
+        self.registry.inc(name, value, **self.labels, **labels)
+
+METRICS = MetricsRegistry()
+
+# ====== Export ======
+def start_http_exporter(registry, port, host="127.0.0.1"):
+    # GET /metrics -> Prometheus text, GET /metrics.json -> JSON snapshot
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, ctype = json.dumps(registry.snapshot()).encode("utf-8"), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, ctype = registry.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+class JsonlExporter:
+    # Appends a registry snapshot to `path` every `interval` seconds and on stop()
+    def __init__(self, registry, path, interval=10.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-jsonl", daemon=True)
+        self.thread.start()
+
+    def dump(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.registry.snapshot()) + "\n")
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.dump()
@@ -0,0 +1,26 @@
+# providers/__init__.py
+import importlib
+
+# Provider name -> "module:Class" of its Provider (see base.py). A provider's SDK
+# is only imported when its module is first loaded, so parsing arguments (and
+# failing fast on bad ones) never pays for together/openai/google-genai. A new
+# endpoint is one small module plus an entry here (or register_provider()).
+PROVIDERS = {
+    "together": "inference.providers.together:TogetherProvider",
+    "gemini": "inference.providers.gemini:GeminiProvider",
+    "nvidia": "inference.providers.nvidia:NvidiaProvider",
+    "vllm": "inference.providers.vllm:VLLMProvider",
+}
+_instances = {}
+
+def register_provider(name, target):
+    PROVIDERS[name] = target
+    _instances.pop(name, None)
+
+def get_provider(name):
+    if name not in PROVIDERS:
+        raise ValueError(f"❌ Unsupported provider: {name}. Use one of {', '.join(PROVIDERS)}.")
+    if name not in _instances:
+        module_name, class_name = PROVIDERS[name].split(":")
+        _instances[name] = getattr(importlib.import_module(module_name), class_name)()
+    return _instances[name]
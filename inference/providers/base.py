@@ -0,0 +1,113 @@
+# base.py
+from time import time as timer
+from inference.answer_detector import StreamMonitor
+from inference.rate_limiter import error_cause, error_status
+
+NO_USAGE = {"prompt": -1, "completion": -1, "total": -1}
+# Client errors (bad request, unknown model, revoked key) fail the same way on
+# every attempt, except request timeouts and conflicts
+RETRYABLE_CLIENT_STATUSES = {408, 409}
+
+def normalize_finish_reason(reason):
+    # Plain lowercase string from SDK enums/strings; Gemini's MAX_TOKENS means "length"
+    if reason is None:
+        return None
+    reason = str(getattr(reason, "value", reason)).lower()
+    return "length" if reason in ("max_tokens", "finish_reason.max_tokens") else reason
+
+def usage_dict(prompt, completion, total):
+    if completion is None:
+        return None
+    return {"prompt": prompt if prompt is not None else -1, "completion": completion,
+            "total": total if total is not None else -1}
+
+class Provider:
+    # One backend: client construction, the request, response and stream parsing,
+    # token usage and error classification. Subclasses implement the hooks below
+    # and are registered in PROVIDERS (providers/__init__.py).
+    name = None
+    default_params = {}
+
+    def make_client(self, api_key, base_url, http_client):
+        raise NotImplementedError
+
+    def make_async_client(self, api_key, base_url, http_client):
+        raise NotImplementedError
+
+    def call(self, client, model, prompt, params, stream=False):
+        raise NotImplementedError
+
+    async def acall(self, client, model, prompt, params, stream=False):
+        raise NotImplementedError
+
+    def response_text(self, response):
+        raise NotImplementedError
+
+    def response_usage(self, response):
+        # Normalised {"prompt", "completion", "total"} dict, or None
+        raise NotImplementedError
+
+    def chunk_delta(self, chunk):
+        raise NotImplementedError
+
+    def response_finish_reason(self, response):
+        return None
+
+    def chunk_usage(self, chunk):
+        return None
+
+    def chunk_finish_reason(self, chunk):
+        return None
+
+    def close_stream(self, response):
+        response.close()
+
+    async def aclose_stream(self, response):
+        await response.close()
+
+    def read(self, response, stream=False, monitor=None):
+        # Full response text. Streams are fed to the monitor delta by delta, which
+        # may end them as soon as the final answer is in (--early_stop)
+        if not stream:
+            return self.response_text(response)
+        monitor = monitor or StreamMonitor(timer())
+        for chunk in response:
+            monitor.usage = self.chunk_usage(chunk) or monitor.usage
+            monitor.finish_reason = self.chunk_finish_reason(chunk) or monitor.finish_reason
+            delta = self.chunk_delta(chunk)
+            if delta and monitor.feed(delta):
+                self.close_stream(response)
+                break
+        return monitor.text()
+
+    async def aread(self, response, stream=False, monitor=None):
+        if not stream:
+            return self.response_text(response)
+        monitor = monitor or StreamMonitor(timer())
+        async for chunk in response:
+            monitor.usage = self.chunk_usage(chunk) or monitor.usage
+            monitor.finish_reason = self.chunk_finish_reason(chunk) or monitor.finish_reason
+            delta = self.chunk_delta(chunk)
+            if delta and monitor.feed(delta):
+                await self.aclose_stream(response)
+                break
+        return monitor.text()
+
+    def usage(self, response, monitor=None):
+        # Streams report usage in their final chunk, kept on the monitor
+        if monitor is not None:
+            return dict(monitor.usage or NO_USAGE)
+        return self.response_usage(response) or dict(NO_USAGE)
+
+    def finish_reason(self, response, monitor=None):
+        # "stop", "length" (cut off by max_tokens), ... or None when unknown
+        if monitor is not None:
+            return normalize_finish_reason(monitor.finish_reason)
+        return normalize_finish_reason(self.response_finish_reason(response))
+
+    def classify_error(self, error):
+        # -> (cause, retryable)
+        cause = error_cause(error)
+        if cause == "client_error":
+            return cause, error_status(error) in RETRYABLE_CLIENT_STATUSES
+        return cause, True
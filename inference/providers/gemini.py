@@ -0,0 +1,67 @@
+# gemini.py
+from google import genai
+from google.genai import types
+from inference.providers.base import Provider, usage_dict
+
+def gemini_usage(metadata):
+    if metadata is None:
+        return None
+    return usage_dict(metadata.prompt_token_count, metadata.candidates_token_count, metadata.total_token_count)
+
+# Single attempt, like OpenAIChatProvider.client_options
+NO_RETRIES = types.HttpRetryOptions(attempts=1)
+
+class GeminiProvider(Provider):
+    name = "gemini"
+    default_params = {}
+
+    def make_client(self, api_key, base_url, http_client):
+        return genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(base_url=base_url, httpx_client=http_client, retry_options=NO_RETRIES),
+        )
+
+    def make_async_client(self, api_key, base_url, http_client):
+        # `.aio` exposes the same `models.generate_content` surface as awaitables
+        return genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(base_url=base_url, httpx_async_client=http_client, retry_options=NO_RETRIES),
+        ).aio
+
+    def config(self, params):
+        if not params:
+            return None
+        return types.GenerateContentConfig(temperature=params.get("temperature"), max_output_tokens=params.get("max_tokens"))
+
+    def call(self, client, model, prompt, params, stream=False):
+        generate = client.models.generate_content_stream if stream else client.models.generate_content
+        return generate(model=model, contents=prompt, config=self.config(params))
+
+    async def acall(self, client, model, prompt, params, stream=False):
+        generate = client.models.generate_content_stream if stream else client.models.generate_content
+        return await generate(model=model, contents=prompt, config=self.config(params))
+
+    def response_text(self, response):
+        return response.text
+
+    def response_usage(self, response):
+        return gemini_usage(getattr(response, "usage_metadata", None))
+
+    def response_finish_reason(self, response):
+        return response.candidates[0].finish_reason if response.candidates else None
+
+    def chunk_delta(self, chunk):
+        return chunk.text
+
+    def chunk_usage(self, chunk):
+        # Every chunk carries the running totals; the last one wins
+        return gemini_usage(chunk.usage_metadata)
+
+    def chunk_finish_reason(self, chunk):
+        return self.response_finish_reason(chunk)
+
+    def close_stream(self, response):
+        response.close()  # a plain generator
+
+    async def aclose_stream(self, response):
+        await response.aclose()
@@ -0,0 +1,14 @@
+# nvidia.py
+from openai import AsyncOpenAI, OpenAI
+from inference.providers.openai_chat import OpenAIChatProvider
+
+class NvidiaProvider(OpenAIChatProvider):
+    name = "nvidia"
+    default_params = {"temperature": 0.1, "max_tokens": 40000}
+    base_url = "https://integrate.api.nvidia.com/v1"
+
+    def make_client(self, api_key, base_url, http_client):
+        return OpenAI(base_url=base_url or self.base_url, api_key=api_key, http_client=http_client, **self.client_options)
+
+    def make_async_client(self, api_key, base_url, http_client):
+        return AsyncOpenAI(base_url=base_url or self.base_url, api_key=api_key, http_client=http_client, **self.client_options)
@@ -0,0 +1,45 @@
+# openai_chat.py
+from inference.providers.base import Provider, usage_dict
+
+def chat_usage(usage):
+    if usage is None:
+        return None
+    return usage_dict(usage.prompt_tokens, usage.completion_tokens, usage.total_tokens)
+
+class OpenAIChatProvider(Provider):
+    # Any OpenAI-compatible /chat/completions endpoint; subclasses only build the client
+    stream_usage = True  # ask for usage in the final stream chunk via stream_options
+    # No SDK-level retries: 429s and 5xx must reach RateLimiter and RetryPolicy
+    client_options = {"max_retries": 0}
+
+    def request(self, model, prompt, params, stream):
+        kwargs = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": stream, **params}
+        if stream and self.stream_usage:
+            kwargs["stream_options"] = {"include_usage": True}
+        return kwargs
+
+    def call(self, client, model, prompt, params, stream=False):
+        return client.chat.completions.create(**self.request(model, prompt, params, stream))
+
+    async def acall(self, client, model, prompt, params, stream=False):
+        return await client.chat.completions.create(**self.request(model, prompt, params, stream))
+
+    def response_text(self, response):
+        return response.choices[0].message.content
+
+    def response_usage(self, response):
+        return chat_usage(getattr(response, "usage", None))
+
+    def response_finish_reason(self, response):
+        return response.choices[0].finish_reason if response.choices else None
+
+    def chunk_delta(self, chunk):
+        if chunk.choices and chunk.choices[0].delta:
+            return chunk.choices[0].delta.content
+        return None
+
+    def chunk_usage(self, chunk):
+        return chat_usage(getattr(chunk, "usage", None))
+
+    def chunk_finish_reason(self, chunk):
+        return chunk.choices[0].finish_reason if chunk.choices else None
@@ -0,0 +1,15 @@
+# together.py
+from together import AsyncTogether, Together
+from inference.providers.openai_chat import OpenAIChatProvider
+
+class TogetherProvider(OpenAIChatProvider):
+    name = "together"
+    default_params = {"temperature": 0.1, "max_tokens": 8192}
+    # The SDK has no stream_options; Together sends usage in the last chunk anyway
+    stream_usage = False
+
+    def make_client(self, api_key, base_url, http_client):
+        return Together(api_key=api_key, base_url=base_url, http_client=http_client, **self.client_options)
+
+    def make_async_client(self, api_key, base_url, http_client):
+        return AsyncTogether(api_key=api_key, base_url=base_url, http_client=http_client, **self.client_options)
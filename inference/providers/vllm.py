@@ -0,0 +1,16 @@
+# vllm.py
+from inference.providers.nvidia import NvidiaProvider
+
+class VLLMProvider(NvidiaProvider):
+    # Self-hosted OpenAI-compatible server (vLLM, SGLang, llama.cpp, ...), e.g.
+    # `vllm serve Qwen/Qwen3-8B`; point elsewhere with --base_url
+    name = "vllm"
+    default_params = {"temperature": 0.1, "max_tokens": 8192}
+    base_url = "http://127.0.0.1:8000/v1"
+
+    def make_client(self, api_key, base_url, http_client):
+        # Local servers usually run without auth, but the SDK insists on some key
+        return super().make_client(api_key or "EMPTY", base_url, http_client)
+
+    def make_async_client(self, api_key, base_url, http_client):
+        return super().make_async_client(api_key or "EMPTY", base_url, http_client)
@@ -0,0 +1,173 @@
+# rate_limiter.py
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+RATE_LIMIT_PATTERN = re.compile(r"\b429\b|rate.?limit|too many requests|resource.?exhausted", re.IGNORECASE)
+RETRY_DELAY_PATTERN = re.compile(r"retry(?:Delay| after| in)[\"':\s]*([\d.]+)\s*(ms|s)?", re.IGNORECASE)
+
+# ====== Error Inspection ======
+def error_status(error):
+    # openai/together expose `status_code`, google-genai exposes `code`
+    for attr in ("status_code", "code"):
+        status = getattr(error, attr, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+def is_rate_limit_error(error):
+    return error_status(error) == 429 or bool(RATE_LIMIT_PATTERN.search(str(error)))
+
+def error_cause(error):
+    # Coarse retry cause for metrics and logs
+    status = error_status(error)
+    name = type(error).__name__.lower()
+    if is_rate_limit_error(error):
+        return "rate_limit"
+    if status is not None and status >= 500:
+        return "server_error"
+    if status is not None and status >= 400:
+        return "client_error"
+    if "timeout" in name:
+        return "timeout"
+    if "connect" in name:
+        return "connection"
+    return "other"
+
+def parse_retry_after(error):
+    # Seconds the server asked us to wait, from headers or the error body, else None
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (AttributeError, TypeError, ValueError):
+        pass
+    match = RETRY_DELAY_PATTERN.search(str(error))
+    if match:
+        delay = float(match.group(1))
+        return delay / 1000 if match.group(2) == "ms" else delay
+    return None
+
+def estimate_tokens(text):
+    return max(1, len(text or "") // 4)
+
+# ====== Token Bucket with AIMD ======
+class RateLimiter:
+    # One limiter per API key. Request and token buckets refill continuously at
+    # the (scaled) per-minute budgets and may go into debt; a caller waits until
+    # its debt is paid. Each observed 429 halves the scale and each success adds
+    # a small step back. An explicit --rpm is a ceiling (scale <= 1.0). Without
+    # one, the budget is re-learned from the throughput observed at every 429:
+    # that throughput triggered it, so the scale restarts at half of it and then
+    # keeps growing past 1.0 to probe for headroom until the next 429.
+    def __init__(self, rpm=None, tpm=None, base_delay=1.0, max_delay=60.0,
+                 burst_seconds=5.0, increase_step=0.05, min_scale=0.05):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.burst_seconds = burst_seconds
+        self.increase_step = increase_step
+        self.min_scale = min_scale
+        self.scale = 1.0
+        self.learn_rpm = rpm is None
+        self.max_scale = 1.0 if rpm else float("inf")
+        self.request_balance = self._capacity(rpm)
+        self.token_balance = self._capacity(tpm)
+        self.blocked_until = 0.0
+        self.updated = time.monotonic()
+        self.recent_successes = deque()
+        self.lock = threading.Lock()
+
+    def _rate(self, per_minute):
+        return per_minute * self.scale / 60.0
+
+    def _capacity(self, per_minute):
+        return max(1.0, self._rate(per_minute) * self.burst_seconds) if per_minute else 0.0
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        if self.rpm:
+            self.request_balance = min(self._capacity(self.rpm), self.request_balance + elapsed * self._rate(self.rpm))
+        if self.tpm:
+            self.token_balance = min(self._capacity(self.tpm), self.token_balance + elapsed * self._rate(self.tpm))
+
+    def reserve(self, tokens=0):
+        # Book one request (plus `tokens`) and return how long the caller must wait
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self.blocked_until - now)
+            if self.rpm:
+                self.request_balance -= 1
+                if self.request_balance < 0:
+                    wait = max(wait, -self.request_balance / self._rate(self.rpm))
+            if self.tpm and tokens:
+                self.token_balance -= tokens
+                if self.token_balance < 0:
+                    wait = max(wait, -self.token_balance / self._rate(self.tpm))
+            return wait
+
+    def acquire(self, tokens=0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self, tokens_used=0):
+        with self.lock:
+            now = time.monotonic()
+            self.recent_successes.append(now)
+            while self.recent_successes and now - self.recent_successes[0] > 60:
+                self.recent_successes.popleft()
+            if self.tpm and tokens_used:
+                self._refill(now)
+                self.token_balance -= tokens_used
+            self.scale = min(self.max_scale, self.scale + self.increase_step)
+
+    def _observed_rpm(self):
+        # None until there is enough history; until then only the pause applies
+        if len(self.recent_successes) < 2:
+            return None
+        window = max(1.0, time.monotonic() - self.recent_successes[0])
+        return len(self.recent_successes) * 60.0 / window
+
+    def backoff_delay(self, attempt):
+        # Full-jitter exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def on_error(self, error, attempt):
+        # Returns the delay before retrying; a 429 also pauses every caller on this key
+        retry_after = parse_retry_after(error)
+        delay = self.backoff_delay(attempt)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        if is_rate_limit_error(error):
+            with self.lock:
+                now = time.monotonic()
+                # 429s from requests already in flight during a pause count as one event
+                if now >= self.blocked_until:
+                    observed = self._observed_rpm() if self.learn_rpm else None
+                    if observed:
+                        # Any scale grown since the last 429 is baked into the observed rate
+                        self.rpm, self.scale = observed, 0.5
+                    else:
+                        self.scale = max(self.min_scale, self.scale / 2)
+                self.blocked_until = max(self.blocked_until, now + delay)
+        return delay
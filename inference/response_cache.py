@@ -0,0 +1,117 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Modes for --cache_mode:
+#   read  - serve hits from the cache and store every new successful response
+#   write - always call the API, refreshing the stored responses
+#   off   - no cache at all
+CACHE_MODES = ["read", "write", "off"]
+
+def make_cache_key(provider, model, prompt, params):
+    payload = json.dumps([provider, model, prompt, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, path="cache/responses.sqlite", mode="read", max_size_mb=2048):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"❌ Unknown cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = self.misses = self.stores = self.evictions = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT,
+                model TEXT,
+                response TEXT,
+                token_usage TEXT,
+                time_usage REAL,
+                size INTEGER,
+                created REAL,
+                last_access REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self.conn.commit()
+        self.total_size = self._stored_size()
+
+    def _stored_size(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        if self.mode != "read":
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, token_usage, time_usage FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return {"response": row[0], "token_usage": json.loads(row[1]), "time_usage": row[2]}
+
+    def put(self, key, provider, model, response_text, token_usage, time_usage):
+        if self.mode == "off":
+            return
+        size = len(response_text.encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response_text, json.dumps(token_usage), time_usage, size, now, now),
+            )
+            self.conn.commit()
+            self.stores += 1
+            self.total_size += size
+            if self.total_size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        # Drop least-recently-used entries until the store is back under 90% of the cap.
+        # Re-sum first: other shards may share the same database file.
+        total = self._stored_size()
+        if total <= self.max_size:
+            self.total_size = total
+            return
+        to_free = total - int(self.max_size * 0.9)
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            to_free -= size
+            if to_free <= 0:
+                break
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.conn.commit()
+        self.evictions += len(victims)
+        self.total_size = self._stored_size()
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_mb": round(self.total_size / 1024 / 1024, 2),
+        }
+
+    def close(self):
+        self.conn.close()
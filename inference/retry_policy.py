@@ -0,0 +1,54 @@
+# retry_policy.py
+
+# Attempts allowed per failure cause for one sample. Transient transport failures
+# are worth several tries; a response that arrived but was cut off by max_tokens
+# (truncated) or had no extractable answer even for the tolerant extractor
+# (no_answer) costs a full generation to retry, so it gets at most one more.
+DEFAULT_BUDGETS = {
+    "rate_limit": 8,
+    "server_error": 5,
+    "timeout": 3,
+    "connection": 5,
+    "other": 3,
+    "client_error": 0,
+    "parse_exception": 2,
+    "no_text": 2,
+    "truncated": 0,
+    "no_answer": 1,
+}
+# Retry ceiling per sample over all causes together
+MAX_ATTEMPTS = 10
+
+def parse_budgets(specs):
+    # ["no_answer=0", "timeout=5"] -> budgets dict, starting from the defaults
+    budgets = dict(DEFAULT_BUDGETS)
+    for spec in specs or []:
+        cause, _, count = spec.partition("=")
+        if cause not in budgets or not count.isdigit():
+            raise ValueError(f"❌ Bad retry budget '{spec}'. Use CAUSE=N with CAUSE in {', '.join(budgets)}.")
+        budgets[cause] = int(count)
+    return budgets
+
+def failure_cause(response_text, finish_reason):
+    # Why a response that did arrive has no usable answer
+    if response_text is None:
+        return "no_text"
+    if finish_reason == "length":
+        return "truncated"
+    return "no_answer"
+
+class RetryPolicy:
+    # Per-sample retry accounting: each cause draws on its own budget
+    def __init__(self, budgets=None, max_attempts=MAX_ATTEMPTS):
+        self.budgets = budgets or DEFAULT_BUDGETS
+        self.max_attempts = max_attempts
+        self.counts = {}
+        self.retries = 0
+
+    def allow(self, cause):
+        # Records one failure of `cause`; True if the sample should be tried again
+        self.counts[cause] = self.counts.get(cause, 0) + 1
+        if self.retries >= self.max_attempts - 1 or self.counts[cause] > self.budgets.get(cause, 0):
+            return False
+        self.retries += 1
+        return True
@@ -0,0 +1,143 @@
+# token_budget.py
+import json
+import math
+import os
+import threading
+from glob import glob
+
+# USD per million (prompt, completion) tokens. List prices at the time of
+# writing; override with --price. Unknown models are counted at 0.
+PRICES = {
+    ("together", "Qwen/Qwen3-235B-A22B-fp8-tput"): (0.20, 0.60),
+    ("gemini", "models/gemini-2.0-flash"): (0.10, 0.40),
+    ("nvidia", "*"): (0.0, 0.0),  # free API credits
+    ("vllm", "*"): (0.0, 0.0),
+}
+# A budget derived from fewer earlier responses than this is not trusted
+MIN_SAMPLES = 200
+BUDGET_QUANTILE = 0.99
+ROUND_TO = 256
+
+# === Per-prompt max_tokens from earlier runs ===
+def history_files(folders, prompt):
+    # Shard files and combined outputs of one prompt in earlier run folders
+    paths = []
+    for folder in folders:
+        for pattern in (f"{prompt}_shard*.json", f"{prompt}_shard*.parquet", f"{prompt}_combined.*", f"{prompt}_output.*"):
+            paths.extend(p for p in glob(os.path.join(folder, pattern)) if p.endswith((".json", ".parquet")))
+    return sorted(set(paths))
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(q * len(values)) - 1)]
+
+def completion_stats(paths, model=None):
+    # Records name their model since request keys were added; older ones carry
+    # none and are counted for whatever model the folder was run with
+    from utils.results_io import iter_records
+    tokens = []
+    for path in paths:
+        for record in iter_records(path):
+            if model and record.get("model") not in (None, model):
+                continue
+            completion = (record.get("token_usage") or {}).get("completion")
+            if completion is not None and completion > 0:
+                tokens.append(completion)
+    if not tokens:
+        return {"count": 0, "quantile": None, "max": None}
+    return {"count": len(tokens), "quantile": quantile(tokens, BUDGET_QUANTILE), "max": max(tokens)}
+
+class TokenBudgets:
+    # Completion-token stats per (provider, model, prompt), persisted as JSON and
+    # recomputed only when one of the scanned result files changed
+    def __init__(self, path="cache/token_budgets.json"):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def stats(self, provider, model, prompt, folders):
+        key = f"{provider}|{model}|{prompt}"
+        signature = {p: file_signature(p) for p in history_files(folders, prompt)}
+        entry = self.entries.get(key)
+        # Entries cached before records were filtered by model carry no "model"
+        if entry is None or entry["files"] != signature or entry.get("model") != model:
+            entry = dict(completion_stats(signature, model), files=signature, model=model)
+            self.entries[key] = entry
+            self.save()
+        return entry
+
+    def max_tokens(self, provider, model, prompt, folders, default=None, margin=0.2):
+        # -> (max_tokens, stats). The historical quantile plus `margin`, rounded up,
+        # never above the provider default; the default while history is too thin.
+        entry = self.stats(provider, model, prompt, folders)
+        if entry["count"] < MIN_SAMPLES:
+            return default, entry
+        budget = math.ceil(entry["quantile"] * (1 + margin) / ROUND_TO) * ROUND_TO
+        return (min(budget, default) if default else budget), entry
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+# === Spend accounting ===
+def price_of(provider, model, override=None):
+    if override:
+        return tuple(override)
+    return PRICES.get((provider, model)) or PRICES.get((provider, "*"))
+
+class SpendTracker:
+    # Cumulative tokens and estimated cost per (provider, model) for the whole
+    # process. Once `max_spend` (USD) is reached no new requests are scheduled;
+    # requests already in flight still finish, so the cap can be overshot by
+    # at most their cost.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.price_override = None
+        self.max_spend = None
+        self.totals = {}
+        self.unpriced = set()
+
+    def configure(self, price=None, max_spend=None):
+        self.price_override = price
+        self.max_spend = max_spend
+
+    def add(self, provider, model, prompt_tokens, completion_tokens):
+        # Returns the estimated cost of this call in USD
+        price = price_of(provider, model, self.price_override)
+        if price is None:
+            self.unpriced.add(f"{provider}/{model}")
+            price = (0.0, 0.0)
+        cost = (prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6
+        with self.lock:
+            totals = self.totals.setdefault((provider, model), {"prompt": 0, "completion": 0, "cost": 0.0})
+            totals["prompt"] += prompt_tokens
+            totals["completion"] += completion_tokens
+            totals["cost"] += cost
+        return cost
+
+    def cost(self):
+        with self.lock:
+            return sum(t["cost"] for t in self.totals.values())
+
+    def exhausted(self):
+        return self.max_spend is not None and self.cost() >= self.max_spend
+
+    def summary_lines(self):
+        lines = [f"{provider}/{model}: {t['prompt']:,} prompt + {t['completion']:,} completion tokens, ~${t['cost']:.4f}"
+                 for (provider, model), t in sorted(self.totals.items())]
+        if self.unpriced:
+            lines.append(f"No price known for {', '.join(sorted(self.unpriced))} (counted as $0, see --price)")
+        if self.max_spend is not None:
+            lines.append(f"Spend ${self.cost():.4f} of ${self.max_spend:.2f} cap")
+        return lines
+
+SPEND = SpendTracker()
@@ -0,0 +1,52 @@
+# transport.py
+import importlib.util
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]"); without it
+# the pool falls back to HTTP/1.1 keep-alive.
+HTTP2 = importlib.util.find_spec("h2") is not None
+# Long read timeout for reasoning models that think for minutes before the first byte
+TIMEOUT = {"timeout": 600.0, "connect": 10.0, "pool": 60.0}
+
+def client_options(max_connections, http2):
+    # httpx is imported on first use, together with the provider SDKs
+    import httpx
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=30.0,
+    )
+    return httpx, {"http2": http2, "limits": limits, "timeout": httpx.Timeout(**TIMEOUT)}
+
+class Transport:
+    # Pooled keep-alive httpx clients handed to every SDK client (all keys, all
+    # providers), so retries and concurrent requests reuse warm TLS connections
+    # instead of each SDK client opening its own. SDK clients built on it must not
+    # be closed individually; close the transport once instead.
+    def __init__(self, max_connections=64, http2=HTTP2):
+        self.max_connections = max_connections
+        self.http2 = http2
+        self.client = None
+        self.async_client = None
+
+    def sync(self):
+        if self.client is None:
+            httpx, options = client_options(self.max_connections, self.http2)
+            self.client = httpx.Client(**options)
+        return self.client
+
+    def asynchronous(self):
+        # Bound to the running event loop: create one Transport per asyncio.run()
+        if self.async_client is None:
+            httpx, options = client_options(self.max_connections, self.http2)
+            self.async_client = httpx.AsyncClient(**options)
+        return self.async_client
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
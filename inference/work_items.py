@@ -0,0 +1,50 @@
+# work_items.py
+import hashlib
+import inspect
+import os
+
+MMLU_COLUMNS = ["question", "choices", "answer", "subject"]
+
+def load_mmlu_test():
+    # `datasets` takes most of a second to import, so only when the data is needed
+    from datasets import load_dataset
+    return load_dataset("cais/mmlu", "all")["test"]
+
+def load_columns(test_split):
+    # One Arrow -> Python conversion per column instead of one row dict per lookup
+    return test_split.select_columns(MMLU_COLUMNS).to_dict()
+
+def _prompt_cache_file(cache_dir, prompt_name, build_prompt, test_split):
+    # Keyed by the dataset fingerprint and the template source, so editing a
+    # prompt in prompts.py never serves stale renders
+    template_hash = hashlib.sha1(inspect.getsource(build_prompt).encode("utf-8")).hexdigest()[:12]
+    fingerprint = getattr(test_split, "_fingerprint", None) or f"n{len(test_split)}"
+    return os.path.join(cache_dir, f"{prompt_name}-{fingerprint}-{template_hash}.parquet")
+
+def render_prompts(columns, build_prompt):
+    return [build_prompt(q, c) for q, c in zip(columns["question"], columns["choices"])]
+
+def load_or_render_prompts(columns, prompt_name, build_prompt, test_split, cache_dir):
+    # Every prompt of one type, memory-mapped from Parquet when rendered before
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = _prompt_cache_file(cache_dir, prompt_name, build_prompt, test_split)
+    if os.path.exists(path):
+        return pq.read_table(path, columns=["prompt"], memory_map=True).column("prompt").to_pylist()
+
+    prompts = render_prompts(columns, build_prompt)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(pa.table({"index": list(range(len(prompts))), "prompt": prompts}), tmp_path)
+    os.replace(tmp_path, path)
+    return prompts
+
+def prepare_work_items(test_split, indices, prompt_name, build_prompt, cache_dir=None, columns=None):
+    # Returns plain (idx, question, choices, answer, prompt) tuples for the inference loop
+    columns = columns or load_columns(test_split)
+    questions, choices, answers = columns["question"], columns["choices"], columns["answer"]
+    if cache_dir:
+        prompts = load_or_render_prompts(columns, prompt_name, build_prompt, test_split, cache_dir)
+        return [(idx, questions[idx], choices[idx], answers[idx], prompts[idx]) for idx in indices]
+    return [(idx, questions[idx], choices[idx], answers[idx], build_prompt(questions[idx], choices[idx])) for idx in indices]
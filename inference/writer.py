@@ -0,0 +1,108 @@
+# writer.py
+import os
+import queue
+import threading
+import time
+
+class WriterHandle:
+    # File-like front for one path, so log_line()/json dumps can keep calling .write()
+    def __init__(self, writer, path):
+        self.writer = writer
+        self.path = path
+
+    def write(self, text):
+        self.writer.write(self.path, text)
+
+    def close(self):
+        pass  # files are closed together in BatchWriter.close()
+
+class BatchWriter:
+    # One background thread owns every output/log file of a run. Callers enqueue
+    # text into a bounded queue; the thread appends it in batches, flushing once
+    # `max_batch` items are pending or `flush_interval` seconds have passed.
+    # Files stay open for the whole run instead of one open/close per record,
+    # and are only fsynced at checkpoints and on close.
+    def __init__(self, max_batch=256, flush_interval=1.0, max_queue=10000):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.files = {}
+        self.pending = {}
+        self.pending_count = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+        self.thread.start()
+
+    def open(self, path):
+        return WriterHandle(self, path)
+
+    def write(self, path, text):
+        self._raise_error()
+        self.queue.put(("write", path, text))
+
+    def sync(self, callback=None, wait=False):
+        # Barrier: everything queued so far is written and fsynced, then `callback` runs
+        self._raise_error()
+        done = threading.Event()
+        self.queue.put(("sync", callback, done))
+        if wait:
+            done.wait()
+            self._raise_error()
+
+    def close(self):
+        self.queue.put(("stop", None, None))
+        self.thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self.error:
+            raise RuntimeError(f"❌ Result writer failed: {self.error}") from self.error
+
+    def _flush(self, fsync=False):
+        for path, parts in self.pending.items():
+            f = self.files.get(path)
+            if f is None:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                f = self.files[path] = open(path, "a", encoding="utf-8", buffering=1 << 20)
+            f.write("".join(parts))
+            f.flush()
+        self.pending = {}
+        self.pending_count = 0
+        if fsync:
+            for f in self.files.values():
+                os.fsync(f.fileno())
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                kind, a, b = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                kind = None
+            try:
+                if kind == "write":
+                    self.pending.setdefault(a, []).append(b)
+                    self.pending_count += 1
+                elif kind in ("sync", "stop"):
+                    self._flush(fsync=True)
+                    last_flush = time.monotonic()
+                    if kind == "sync":
+                        if a:
+                            a()
+                        b.set()
+                    else:
+                        for f in self.files.values():
+                            f.close()
+                        return
+                if self.pending_count >= self.max_batch or (
+                    self.pending_count and time.monotonic() - last_flush >= self.flush_interval
+                ):
+                    self._flush()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                self.error = e
+                if kind == "sync":
+                    b.set()
+                elif kind == "stop":
+                    return
@@ -1,38 +1,60 @@
 import argparse
-import os, json, re
+import asyncio
+import io
+import os, json
 import time
 from time import time as timer
 from pathlib import Path
 from datetime import datetime
-from datasets import load_dataset
-from together import Together
 from dotenv import load_dotenv
 from tqdm import tqdm
 from prompts.prompts import prompt_map
-import openai
-from google import genai
-from google.genai import types
+from inference.key_pool import KeyPool, discover_keys, is_quota_error
+from inference.rate_limiter import RateLimiter, estimate_tokens
+from inference.response_cache import CACHE_MODES, ResponseCache, make_cache_key
+from inference.checkpoint import CompletionCheckpoint, checkpoint_path
+from inference.work_items import load_mmlu_test, prepare_work_items
+from inference.writer import BatchWriter
+from inference.answer_detector import StreamMonitor
+from inference.answer_extractor import extract_answer
+from inference.dedup import DedupIndex, make_request_key, read_referenced
+from inference.token_budget import MIN_SAMPLES, SPEND, TokenBudgets
+from inference.retry_policy import RetryPolicy, failure_cause, parse_budgets
+from inference.metrics import METRICS, JsonlExporter, start_http_exporter
+from inference.transport import Transport
+from inference.providers import PROVIDERS, get_provider
+from inference.batch import (GeminiBatchBackend, LocalBatchBackend, OpenAIBatchBackend, batch_state_path,
+                             load_batch_state, save_batch_state, wait_for_batch, write_jsonl)
+from utils.results_io import RESULTS_FORMATS, ParquetParts, parquet_path
 
 # ====== API Setup ======
-def get_client(provider, api_key):
+GEMINI_MODEL = "models/gemini-2.0-flash"
+
+# SDK clients are cached per (provider, key, endpoint) and share one pooled transport
+TRANSPORT = Transport()
+_clients = {}
+
+def get_client(provider, api_key, base_url=None, transport=TRANSPORT):
+    # `base_url` points Together/NVIDIA at another OpenAI-compatible server (e.g. benchmarks/mock_server.py)
+    cache_key = (provider, api_key, base_url)
+    if cache_key in _clients:
+        return _clients[cache_key]
     load_dotenv()
-    if provider == "together":
-        return Together(api_key=os.getenv(api_key))
-    elif provider == "gemini":
-        genai.Client(api_key=os.getenv(api_key))
-        return genai
-    elif provider == "nvidia":
-        from openai import OpenAI
-        return OpenAI(
-            base_url="https://integrate.api.nvidia.com/v1",
-            api_key=os.getenv(api_key),
-        )
-    else:
-        raise ValueError("❌ Unsupported provider. Use 'together' or 'gemini'.")
+    client = get_provider(provider).make_client(os.getenv(api_key), base_url, transport.sync())
+    _clients[cache_key] = client
+    return client
+
+def get_async_client(provider, api_key, base_url=None, transport=None):
+    # Async clients are bound to the event loop, so run_concurrent builds them with its own Transport
+    transport = transport or Transport()
+    load_dotenv()
+    return get_provider(provider).make_async_client(os.getenv(api_key), base_url, transport.asynchronous())
 
 # ====== Logger Setup ======
-def create_logger(name, folder, shard_id):
+def create_logger(name, folder, shard_id, writer=None):
     path = Path(f"log/{folder}/{name}_shard{shard_id}.log")
+    if writer:
+        return writer.open(str(path))
     return open(path, "a", encoding="utf-8")
 
 def log_line(logger, msg, mode):
@@ -42,99 +64,463 @@ def log_line(logger, msg, mode):
         logger.write(msg + "\n")
 
 # ====== API Call and Response Handling ======
-def call_api(client, provider, model_name, prompt, use_stream=False):
+# Requests, stream parsing and usage live in inference/providers (one Provider per backend)
+def sampling_params(args):
+    # Provider defaults, with the shard's completion budget (--max_tokens / --max_tokens_from) when set
+    params = get_provider(args.provider).default_params
+    if getattr(args, "max_tokens", None):
+        params = dict(params, max_tokens=args.max_tokens)
+    return params
+
+def call_api(client, provider, model_name, prompt, params, use_stream=False):
     try:
-        if provider == "gemini":
-            response = client.models.generate_content(
-                model="models/gemini-2.0-flash",
-                contents=prompt
-            )
-        elif provider == "together":
-            response = client.chat.completions.create(
-                model=model_name,
-                temperature=0.1,
-                max_new_tokens=8192,
-                messages=[{"role": "user", "content": prompt}],
-                stream=use_stream
-            )
-        elif provider == "nvidia":
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                max_tokens=40000,
-                stream=use_stream
-            )
-        else:
-            raise ValueError("Unsupported provider")
-        return response, None
+        return provider.call(client, model_name, prompt, params, use_stream), None
     except Exception as e:
-        return None, str(e)
-
-
-def extract_response_text(response, provider, use_stream=False):
-    if provider == "gemini":
-        return response.text
-    elif provider == "together":
-        if use_stream:
-            text_parts = []
-            for chunk in response:
-                delta = chunk.choices[0].delta.content if chunk.choices[0].delta else ""
-                if delta:
-                    text_parts.append(delta)
-            return "".join(text_parts)
-        else:
-            return response.choices[0].message.content
-    elif provider == "nvidia":
-        if use_stream:
-            text_parts = []
-            for chunk in response:
-                delta = chunk.choices[0].delta.content if chunk.choices[0].delta else ""
-                if delta:
-                    text_parts.append(delta)
-            return "".join(text_parts)
-        else:
-            return response.choices[0].message.content
-
-def extract_response_ans(text):
-    match = re.search(r"The answer is\s*\((\w)\)", text)
-    if match:
-        return ord(match.group(1).lower()) - ord('a')
-    return None
-
-def extract_token_usage(response):
-    if hasattr(response, "usage") and response.usage:
-        return {
-            "prompt": response.usage.prompt_tokens,
-            "completion": response.usage.completion_tokens,
-            "total": response.usage.total_tokens,
-        }
-    return {"prompt": -1, "completion": -1, "total": -1}
-
-def dump_json(data, output_file):
-    with open(output_file, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(data, ensure_ascii=False) + '\n')
-
-# ====== Main Execution Function ======
-def run_experiment(args):
-    client = get_client(args.provider, args.api_key)
-    prompt_name = args.prompt
-    model_name = args.model
-    folder_name = args.folder
-    start, end = args.start, args.end
-    output_file = f"temp/{folder_name}/{prompt_name}_shard{args.shard_id}.json"
-
-    os.makedirs(f"temp/{folder_name}", exist_ok=True)
-    os.makedirs(f"log/{folder_name}", exist_ok=True)
+        return None, e
 
-    log_file = create_logger(prompt_name, folder_name, args.shard_id)
-    error_log_file = create_logger(f"{prompt_name}_error_index", folder_name, args.shard_id)
-    error_indices = []
+async def async_call_api(client, provider, model_name, prompt, params, use_stream=False):
+    try:
+        return await provider.acall(client, model_name, prompt, params, use_stream), None
+    except Exception as e:
+        return None, e
+
+class ShardOutput:
+    # Queues records for the shard output on the batch writer and marks them in the
+    # completion checkpoint. The checkpoint is only saved once the writer has
+    # flushed and fsynced every record it covers. With --results_format parquet/both,
+    # records also go to Parquet parts, written at the same checkpoints.
+    def __init__(self, path, writer, checkpoint=None, results_format="jsonl"):
+        self.path = path
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.jsonl = results_format in ("jsonl", "both")
+        self.parts = ParquetParts(parquet_path(path)) if results_format in ("parquet", "both") else None
+
+    def write(self, data):
+        if self.jsonl:
+            self.writer.write(self.path, json.dumps(data, ensure_ascii=False) + '\n')
+        if self.parts:
+            self.parts.add(data)
+        if self.checkpoint:
+            self.checkpoint.mark(data["index"])
+            if self.checkpoint.should_save():
+                self.save_checkpoint()
+
+    def save_checkpoint(self, wait=False):
+        checkpoint = self.checkpoint
+        bits = checkpoint.snapshot() if checkpoint else None
+        rows = self.parts.take() if self.parts else []
+        def save():
+            if rows:
+                self.parts.write_part(rows)
+            if checkpoint:
+                checkpoint.save(os.path.getsize(self.path) if os.path.exists(self.path) else 0, bits)
+        self.writer.sync(save, wait=wait)
+
+    def close(self):
+        if (self.checkpoint and self.checkpoint.unsaved) or (self.parts and self.parts.rows):
+            self.save_checkpoint(wait=True)
+
+# ====== Per-Sample Processing ======
+
+def log_sample_header(log_file, idx, prompt, mode):
+    log_line(log_file, f"\n--- Sample {idx} ---", mode)
+    log_line(log_file, f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", mode)
+    log_line(log_file, f"Prompt: {prompt}", mode)
+
+def parse_response(response_text, token_usage, log_file, mode, num_choices=4, finish_reason=None):
+    # Returns (response_ans, token_usage, extraction_method), or None when no answer could be extracted
+    log_line(log_file, f"Response: {response_text}", mode)
+    response_ans, method = extract_answer(response_text, num_choices)
+    log_line(log_file, f"Response Answer: {response_ans}" + (f" ({method})" if method and method != "strict" else ""), mode)
+    log_line(log_file, f"Token Usage: {token_usage}", mode)
+
+    if response_text is None:
+        log_line(log_file, f"⚠️ No response text found.", mode)
+        return None
+    if response_ans is None:
+        truncated = " (truncated at max_tokens)" if finish_reason == "length" else ""
+        log_line(log_file, f"⚠️ No answer found in response{truncated}.", mode)
+        return None
+    return response_ans, token_usage, method
+
+def record_result(item, response_ans, response_text, elapsed_time, token_usage, output, log_file, mode, timing=None,
+                  extraction_method="strict", request=None):
+    idx, question, choices, answer, prompt = item
+    correct = response_ans == answer
+    data = {
+        "index": idx,
+        "question": question,
+        "choices": choices,
+        "answer": answer,
+        "response_ans": response_ans,
+        "correct": correct,
+        "prompt": prompt,
+        "response": response_text,
+        "time_usage": elapsed_time,
+        "token_usage": token_usage,
+        "extraction_method": extraction_method,
+    }
+    if timing:
+        data["timing"] = timing
+    if request:
+        # model, temperature and request_key; kept last so the dedup index can read them off the line end
+        data.update(request)
+
+    if mode == "run":
+        output.write(data)
+
+    # Response, answer and token usage were already logged by parse_response()
+    log_line(log_file, f"Correct: {correct}", mode)
+    if elapsed_time is not None:  # batch results carry no per-request latency
+        log_line(log_file, f"Timing Info: {elapsed_time:.2f}s" + (f" {timing}" if timing else ""), mode)
+
+def request_model_name(args):
+    return GEMINI_MODEL if args.provider == "gemini" else args.model
+
+def request_fields(args, prompt):
+    # What identifies a request for the dedup planner (see inference/dedup.py)
+    model, params = request_model_name(args), sampling_params(args)
+    if args.early_stop:
+        params = dict(params, early_stop=True)
+    return {"model": model, "temperature": params.get("temperature"), "request_key": make_request_key(model, params, prompt)}
+
+def cache_key(args, prompt):
+    # Keyed on the provider defaults, not the shard's max_tokens: a response that
+    # finished under a tighter budget is just as valid, and truncated ones
+    # (finish_reason "length") are not stored
+    params = get_provider(args.provider).default_params
+    if args.early_stop:
+        # Early-stopped responses are cut after the answer, so they are cached apart
+        params = dict(params, early_stop=True)
+    return make_cache_key(args.provider, request_model_name(args), prompt, params)
+
+def serve_from_cache(response_cache, args, item, output, log_file):
+    cached = response_cache.get(cache_key(args, item[4]))
+    if cached is None:
+        return False
+    log_line(log_file, "💾 Cache hit", args.mode)
+    parsed = parse_response(cached["response"], cached["token_usage"], log_file, args.mode, len(item[2]))
+    if parsed is None:
+        return False
+    response_ans, token_usage, method = parsed
+    record_result(item, response_ans, cached["response"], cached["time_usage"], token_usage, output, log_file, args.mode,
+                  extraction_method=method, request=request_fields(args, item[4]))
+    return True
+
+def store_in_cache(response_cache, args, prompt, response_text, token_usage, elapsed_time):
+    response_cache.put(cache_key(args, prompt), args.provider, request_model_name(args), response_text, token_usage, elapsed_time)
+
+def account_tokens(args, model_name, prompt, response_text, token_usage, metrics):
+    # Every generated response is paid for, answered or not
+    prompt_tokens = token_usage["prompt"] if token_usage["prompt"] > 0 else estimate_tokens(prompt)
+    completion_tokens = token_usage["completion"] if token_usage["completion"] > 0 else estimate_tokens(response_text or "")
+    metrics.inc("cost_usd_total", SPEND.add(args.provider, model_name, prompt_tokens, completion_tokens))
+
+def observe_success(metrics, monitor, elapsed_time, write_time, token_usage, completion_tokens):
+    ttft = monitor.ttft if monitor else None
+    if ttft is not None:
+        metrics.phase("ttft", ttft)
+        metrics.phase("stream", elapsed_time - ttft)
+    metrics.phase("write", write_time)
+    metrics.phase("total", elapsed_time)
+    generation_time = elapsed_time - (ttft or 0)
+    if generation_time > 0:
+        metrics.observe("tokens_per_second", completion_tokens / generation_time)
+    metrics.inc("tokens_total", completion_tokens, kind="completion")
+    if token_usage["prompt"] > 0:
+        metrics.inc("tokens_total", token_usage["prompt"], kind="prompt")
+    metrics.inc("samples_total", result="ok")
+
+class SampleRun:
+    # One sample through cache, rate limiter, retry policy, accounting, parsing and
+    # recording. run_sample and run_sample_async drive it and differ only in
+    # whether the limiter wait, the API call, the read and the backoff block or await.
+    # Each step returns None to try again, else the final "ok", "failed" or "quota".
+    def __init__(self, limiter, response_cache, args, item, output, log_file, metrics=None):
+        self.limiter = limiter
+        self.response_cache = response_cache
+        self.args = args
+        self.item = item
+        self.output = output
+        self.log_file = log_file
+        self.prompt = item[4]
+        self.provider, self.model_name, self.params = get_provider(args.provider), request_model_name(args), sampling_params(args)
+        self.metrics = metrics or METRICS.bind(key="-", provider=args.provider, model=self.model_name)
+        self.policy = RetryPolicy(parse_budgets(args.retry_budget))
+        self.monitor = None
+        log_sample_header(log_file, item[0], self.prompt, args.mode)
+
+    def from_cache(self):
+        if self.response_cache and serve_from_cache(self.response_cache, self.args, self.item, self.output, self.log_file):
+            self.metrics.inc("samples_total", result="cache_hit")
+            return True
+        return False
+
+    def start(self, wait_start):
+        # The limiter let the request through
+        self.start_time = timer()
+        self.metrics.phase("rate_limit_wait", self.start_time - wait_start)
+        self.monitor = StreamMonitor(self.start_time, self.args.early_stop) if self.args.stream else None
+
+    def connected(self):
+        # Only a stream returns at the headers; a blocking call returns the whole
+        # generation, which the "total" phase already covers
+        if self.monitor:
+            self.metrics.phase("connect", timer() - self.start_time)
+
+    def on_error(self, error):
+        # -> (status, delay before the next attempt)
+        cause, retryable = self.provider.classify_error(error)
+        self.metrics.inc("retries_total", cause=cause)
+        log_line(self.log_file, f"⚠️ API Error ({cause}): {error}", self.args.mode)
+        if is_quota_error(error):
+            return "quota", 0
+        if not retryable or not self.policy.allow(cause):
+            return self.give_up(), 0
+        delay = self.limiter.on_error(error, self.policy.retries - 1)
+        log_line(self.log_file, f"⏳ Retrying in {delay:.1f}s", self.args.mode)
+        return None, delay
+
+    def on_exception(self, e):
+        self.metrics.inc("retries_total", cause="parse_exception")
+        log_line(self.log_file, f"⚠️ Exception parsing response: {e}", self.args.mode)
+        return None if self.policy.allow("parse_exception") else self.give_up()
+
+    def on_response(self, response, response_text):
+        args, metrics = self.args, self.metrics
+        try:
+            read_done = timer()
+            elapsed_time = read_done - self.start_time
+            token_usage = self.provider.usage(response, self.monitor)
+            account_tokens(args, self.model_name, self.prompt, response_text, token_usage, metrics)
+            finish_reason = self.provider.finish_reason(response, self.monitor)
+            parsed = parse_response(response_text, token_usage, self.log_file, args.mode, len(self.item[2]), finish_reason)
+        except Exception as e:
+            return self.on_exception(e)
+        metrics.phase("parse", timer() - read_done)
+        if parsed is None:
+            # Re-generating costs a full response, so these causes have small budgets
+            cause = failure_cause(response_text, finish_reason)
+            metrics.inc("retries_total", cause=cause)
+            return None if self.policy.allow(cause) else self.give_up()
+
+        response_ans, token_usage, method = parsed
+        if method != "strict":
+            metrics.inc("salvaged_total", method=method)
+        completion_tokens = token_usage["completion"] if token_usage["completion"] > 0 else estimate_tokens(response_text)
+        self.limiter.on_success(completion_tokens)
+        if self.response_cache and finish_reason != "length":
+            # A truncated response salvaged by the tolerant extractor stays out of the
+            # cache, which is shared across max_tokens budgets (see cache_key)
+            store_in_cache(self.response_cache, args, self.prompt, response_text, token_usage, elapsed_time)
+        write_start = timer()
+        record_result(self.item, response_ans, response_text, elapsed_time, token_usage, self.output, self.log_file, args.mode,
+                      self.monitor.timing() if self.monitor else None, method, request_fields(args, self.prompt))
+        observe_success(metrics, self.monitor, elapsed_time, timer() - write_start, token_usage, completion_tokens)
+        return "ok"
+
+    def give_up(self):
+        log_line(self.log_file, f"❌ Giving up after {self.policy.retries + 1} attempt(s): {self.policy.counts}", self.args.mode)
+        self.metrics.inc("samples_total", result="failed")
+        return "failed"
+
+def run_sample(client, limiter, response_cache, args, item, output, log_file, metrics=None):
+    # Returns "ok", "failed", or "quota" when the key should leave the rotation
+    sample = SampleRun(limiter, response_cache, args, item, output, log_file, metrics)
+    if sample.from_cache():
+        return "ok"
+    status = None
+    while status is None:
+        wait_start = timer()
+        limiter.acquire(estimate_tokens(sample.prompt))
+        sample.start(wait_start)
+        response, error = call_api(client, sample.provider, sample.model_name, sample.prompt, sample.params, args.stream)
+        sample.connected()
+        if response is None:
+            status, delay = sample.on_error(error)
+            if status is None:
+                time.sleep(delay)
+            continue
+        try:
+            response_text = sample.provider.read(response, args.stream, sample.monitor)
+        except Exception as e:
+            status = sample.on_exception(e)
+            continue
+        status = sample.on_response(response, response_text)
+    return status
+
+async def run_sample_async(client, limiter, response_cache, args, item, output, log_file, metrics=None):
+    # Same as run_sample, awaiting instead of blocking
+    sample = SampleRun(limiter, response_cache, args, item, output, log_file, metrics)
+    if sample.from_cache():
+        return "ok"
+    status = None
+    while status is None:
+        wait_start = timer()
+        await limiter.acquire_async(estimate_tokens(sample.prompt))
+        sample.start(wait_start)
+        response, error = await async_call_api(client, sample.provider, sample.model_name, sample.prompt, sample.params, args.stream)
+        sample.connected()
+        if response is None:
+            status, delay = sample.on_error(error)
+            if status is None:
+                await asyncio.sleep(delay)
+            continue
+        try:
+            response_text = await sample.provider.aread(response, args.stream, sample.monitor)
+        except Exception as e:
+            status = sample.on_exception(e)
+            continue
+        status = sample.on_response(response, response_text)
+    return status
+
+# ====== Concurrent Execution ======
+async def run_concurrent(args, key_pool, response_cache, shards):
+    # Every active key runs `args.concurrency` workers pulling from one shared
+    # queue, so fast keys take more indices and an exhausted key just drops out.
+    # Each sample logs into its own buffer so the shard log reads exactly like a
+    # sequential run. Items of several shards (a sweep) are interleaved, so every
+    # prompt advances together and the keys stay busy until the last one drains.
+    # Entries are (enqueue time, shard, item) so queue wait can be measured
+    queue = asyncio.Queue()
+    for shard, item in interleave(shards):
+        queue.put_nowait((timer(), shard, item))
+
+    desc = f"Running {shards[0].args.prompt}" if len(shards) == 1 else f"Running {len(shards)} shards"
+    pbar = tqdm(total=queue.qsize(), desc=desc)
+
+    async def worker(key_name, client, limiter):
+        # Stops taking new items once the --max_spend cap is reached
+        while key_pool.is_active(key_name) and not SPEND.exhausted():
+            enqueued, shard, item = await queue.get()
+            metrics = METRICS.bind(key=key_name, provider=args.provider, model=request_model_name(shard.args))
+            metrics.phase("queue_wait", timer() - enqueued)
+            try:
+                sample_log = io.StringIO()
+                status = await run_sample_async(client, limiter, response_cache, shard.args, item, shard.output, sample_log, metrics)
+                shard.log_file.write(sample_log.getvalue())
+                if status == "quota":
+                    key_pool.retire(key_name, "quota error")
+                    queue.put_nowait((timer(), shard, item))
+                    continue
+                if status == "failed":
+                    shard.error_indices.append(item[0])
+                pbar.update(1)
+            finally:
+                queue.task_done()
+
+    # One connection pool for all keys; sized so every worker can hold a connection
+    transport = Transport(max_connections=max(10, len(key_pool.keys) * args.concurrency))
+    clients = {key_name: get_async_client(args.provider, key_name, args.base_url, transport) for key_name in key_pool.keys}
+    limiters = {key_name: RateLimiter(args.rpm, args.tpm) for key_name in key_pool.keys}
+    workers = [
+        asyncio.create_task(worker(key_name, client, limiters[key_name]))
+        for key_name, client in clients.items()
+        for _ in range(args.concurrency)
+    ]
+    drained = asyncio.create_task(queue.join())
+    all_retired = asyncio.gather(*workers, return_exceptions=True)
+    await asyncio.wait([drained, all_retired], return_when=asyncio.FIRST_COMPLETED)
+
+    drained.cancel()
+    for task in workers:
+        task.cancel()
+    for result in await all_retired:
+        if isinstance(result, Exception):
+            raise result
+    pbar.close()
+
+    # Whatever is left over ran out of keys (or budget)
+    while not queue.empty():
+        _, shard, item = queue.get_nowait()
+        shard.error_indices.append(item[0])
+    if key_pool.retired:
+        print(f"🔑 Retired keys: {', '.join(key_pool.retired)}")
+
+    await transport.aclose()
+
+def interleave(shards):
+    # Round-robin over the shards' work items: (shard, item) pairs
+    pending = [(shard, iter(shard.work_items)) for shard in shards]
+    while pending:
+        still_pending = []
+        for shard, items in pending:
+            item = next(items, None)
+            if item is not None:
+                yield shard, item
+                still_pending.append((shard, items))
+        pending = still_pending
+
+# ====== Batch Execution ======
+def make_batch_backend(args, api_key):
+    params = sampling_params(args)
+    if args.batch_backend == "local":
+        # Answered through any OpenAI-compatible --base_url, else by whoever writes output.jsonl
+        client = get_client("nvidia", api_key, args.base_url) if args.base_url else None
+        return LocalBatchBackend(args.batch_dir, request_model_name(args), params, client)
+    client = get_client(args.provider, api_key, args.base_url)
+    if args.provider == "gemini":
+        return GeminiBatchBackend(client, GEMINI_MODEL, params)
+    return OpenAIBatchBackend(client, args.provider, args.model, params)
+
+def run_batch(args, key_pool, work_items, output, log_file, output_file):
+    # Submits every pending prompt as one provider batch job, polls it and ingests
+    # the results into the normal shard output. The job id is saved first, so a
+    # rerun of the same command resumes polling instead of resubmitting.
+    items = {item[0]: item for item in work_items}
+    backend = make_batch_backend(args, key_pool.keys[0])
+    state_path = batch_state_path(args.batch_dir, output_file)
+    state = load_batch_state(state_path)
+
+    if state is None or state["ingested"]:
+        if not items:
+            return []
+        input_path = os.path.splitext(state_path)[0] + ".input.jsonl"
+        write_jsonl(input_path, (backend.format_line(idx, item[4]) for idx, item in items.items()))
+        batch_id = backend.submit(input_path)
+        state = {"batch_id": batch_id, "backend": args.batch_backend, "provider": args.provider,
+                 "submitted": datetime.now().isoformat(), "count": len(items), "ingested": False}
+        save_batch_state(state_path, state)
+        print(f"📦 Submitted batch {batch_id} with {len(items)} request(s)")
+    else:
+        print(f"📦 Resuming batch {state['batch_id']} submitted {state['submitted']}")
+
+    status = wait_for_batch(backend, state["batch_id"], args.batch_poll)
+    if status != "completed":
+        # A failed, expired or cancelled job is done with: the next run submits afresh
+        state.update(status=status, ingested=True)
+        save_batch_state(state_path, state)
+        print(f"❌ Batch {state['batch_id']} ended as {status}")
+        return sorted(items)
+
+    error_indices, seen = [], set()
+    metrics = METRICS.bind(key="batch", provider=args.provider, model=request_model_name(args))
+    for idx, response_text, token_usage, error in tqdm(backend.results(state["batch_id"]), desc=f"Ingesting {args.prompt}"):
+        item = items.get(idx)
+        if item is None or idx in seen:
+            continue
+        seen.add(idx)
+        log_sample_header(log_file, idx, item[4], "run")
+        if error:
+            log_line(log_file, f"⚠️ API Error (batch): {error}", "run")
+            error_indices.append(idx)
+            continue
+        account_tokens(args, request_model_name(args), item[4], response_text, token_usage, metrics)
+        parsed = parse_response(response_text, token_usage, log_file, "run", len(item[2]))
+        if parsed is None:
+            error_indices.append(idx)
+            continue
+        record_result(item, parsed[0], response_text, None, token_usage, output, log_file, "run",
+                      extraction_method=parsed[2], request=request_fields(args, item[4]))
 
-    ds = load_dataset("cais/mmlu", "all")
-    build_prompt = prompt_map[prompt_name]
+    state.update(status=status, ingested=True)
+    save_batch_state(state_path, state)
+    # Requests the provider dropped without an output or error line
+    return sorted(error_indices + [idx for idx in items if idx not in seen])
 
-    # Determine indices to run
+# ====== Main Execution Function ======
+def select_indices(args):
     if args.indices:
         indices_to_run = list(map(int, args.indices.split(",")))
         print(f"🎯 Using manually specified indices: {len(indices_to_run)} items")
@@ -146,110 +532,204 @@ def run_experiment(args):
                                  set(missing_data.get("response_missing_list", [])))
         print(f"🔄 Filling missing indices for {args.fill_missing}: {len(indices_to_run)} items")
     else:
-        indices_to_run = list(range(start, end))
-
-
-    for idx in tqdm(indices_to_run, desc=f"Running {prompt_name}"):
-        question = ds['test'][idx]['question']
-        choices = ds['test'][idx]['choices']
-        answer = ds['test'][idx]['answer']
-        prompt = build_prompt(question, choices)
-
-        log_line(log_file, f"\n--- Sample {idx} ---", args.mode)
-        log_line(log_file, f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", args.mode)
-        log_line(log_file, f"Prompt: {prompt}", args.mode)
-
-        retry_count = 0
-        max_retries = 5
-        success = False
-
-        while retry_count < max_retries:
-            start_time = timer()
-            response, error_message = call_api(client, args.provider, model_name, prompt, args.stream)
-            elapsed_time = timer() - start_time
-
-            if response is None:
-                log_line(log_file, f"⚠️ API Error: {error_message}", args.mode)
-                retry_count += 1
+        indices_to_run = list(range(args.start, args.end))
+    return indices_to_run
+
+class ShardRun:
+    # One (prompt, model) shard: its output file, logs, checkpoint and pending work items
+    def __init__(self, args, writer, test_split, columns=None, dedup_index=None):
+        self.args = args
+        prompt_name, folder_name = args.prompt, args.folder
+        self.output_file = f"temp/{folder_name}/{prompt_name}_shard{args.shard_id}.json"
+
+        os.makedirs(f"temp/{folder_name}", exist_ok=True)
+        os.makedirs(f"log/{folder_name}", exist_ok=True)
+
+        self.log_file = create_logger(prompt_name, folder_name, args.shard_id, writer)
+        self.error_log_file = create_logger(f"{prompt_name}_error_index", folder_name, args.shard_id, writer)
+        self.error_indices = []
+
+        self.output = ShardOutput(self.output_file, writer, results_format=args.results_format)
+        if args.mode in ("run", "batch"):
+            # Always brought up to date so a later --resume also sees this run's predecessors
+            self.output.checkpoint = CompletionCheckpoint(checkpoint_path(self.output_file)).load()
+            self.output.checkpoint.catch_up(self.output_file)
+
+        indices_to_run = select_indices(args)
+        if args.resume and self.output.checkpoint:
+            total = len(indices_to_run)
+            indices_to_run = [idx for idx in indices_to_run if not self.output.checkpoint.is_done(idx)]
+            print(f"⏩ Resuming {prompt_name}: {total - len(indices_to_run)} of {total} indices already done")
+
+        if args.max_tokens_from and not args.max_tokens:
+            budgets = TokenBudgets(args.token_budget_path)
+            default = get_provider(args.provider).default_params.get("max_tokens")
+            args.max_tokens, stats = budgets.max_tokens(args.provider, request_model_name(args), prompt_name,
+                                                        args.max_tokens_from, default, args.max_tokens_margin)
+            if stats["count"] >= MIN_SAMPLES:
+                print(f"🎚️ {prompt_name}: max_tokens {args.max_tokens} (p99 {stats['quantile']} over {stats['count']} earlier responses)")
+            else:
+                print(f"🎚️ {prompt_name}: only {stats['count']} earlier responses, keeping max_tokens {args.max_tokens}")
+
+        self.work_items = prepare_work_items(test_split, indices_to_run, prompt_name, prompt_map[prompt_name],
+                                             args.prompt_cache_dir, columns)
+        if dedup_index and self.work_items:
+            self.work_items = self.materialise_duplicates(dedup_index)
+
+    def materialise_duplicates(self, dedup_index):
+        # Items whose request (prompt text, model, temperature) was already answered in
+        # any indexed result file are copied in from there; only the rest is dispatched
+        args = self.args
+        requests = {item[0]: request_fields(args, item[4]) for item in self.work_items}
+        references = dedup_index.lookup({r["request_key"] for r in requests.values()})
+        sources = read_referenced(references)
+        pending = []
+        for item in self.work_items:
+            request = requests[item[0]]
+            source = sources.get(request["request_key"])
+            if source is None or source.get("response_ans") is None:
+                pending.append(item)
                 continue
+            log_sample_header(self.log_file, item[0], item[4], args.mode)
+            log_line(self.log_file, f"♻️ Duplicate of {references[request['request_key']][0]}", args.mode)
+            token_usage = source.get("token_usage") or {"prompt": -1, "completion": -1, "total": -1}
+            record_result(item, source["response_ans"], source.get("response"), source.get("time_usage"), token_usage,
+                          self.output, self.log_file, "test" if args.mode == "test" else "run", source.get("timing"),
+                          source.get("extraction_method") or "strict", request)
+        if len(pending) < len(self.work_items):
+            print(f"♻️ {args.prompt}: {len(self.work_items) - len(pending)} of {len(self.work_items)} items already answered elsewhere")
+        return pending
+
+    def finish(self):
+        if self.error_indices:
+            log_line(self.error_log_file, f"Error Indices: {sorted(self.error_indices)}", self.args.mode)
+        else:
+            print(f"No errors encountered ({self.args.prompt}).")
+        self.output.close()
+        self.log_file.close()
+        self.error_log_file.close()
+
+def run_shards(args, shard_args, test_split=None, columns=None):
+    # Runs one or more shards (see sweep.py) with one writer thread, one response
+    # cache, one key pool and one metrics registry shared between them
+    parse_budgets(args.retry_budget)  # fail on a bad --retry_budget before any work
+    SPEND.configure(args.price, args.max_spend)
+    writer = BatchWriter(args.write_batch, args.write_interval)
+    test_split = test_split or load_mmlu_test()
+    dedup_index = None
+    if args.dedup:
+        dedup_index = DedupIndex(args.dedup_index)
+        added = dedup_index.refresh(args.dedup_roots)
+        print(f"♻️ Dedup index: {dedup_index.count()} records ({added} new) under {', '.join(args.dedup_roots)}")
+    shards = [ShardRun(a, writer, test_split, columns, dedup_index) for a in shard_args]
+    if dedup_index:
+        dedup_index.close()
+
+    # Live metrics: Prometheus text on http://127.0.0.1:{port}/metrics and/or periodic JSONL snapshots
+    metrics_server = start_http_exporter(METRICS, args.metrics_port) if args.metrics_port else None
+    metrics_exporter = JsonlExporter(METRICS, args.metrics_path, args.metrics_interval) if args.metrics_path else None
+
+    response_cache = ResponseCache(args.cache_path, args.cache_mode, args.cache_max_mb) if args.cache_mode != "off" else None
+    key_pool = KeyPool(args.api_key or (discover_keys(args.key_pattern) if args.key_pattern else []))
 
-            try:
-                response_text = extract_response_text(response, args.provider, args.stream)
-                log_line(log_file, f"Response: {response_text}", args.mode)
-                response_ans = extract_response_ans(response_text)
-                log_line(log_file, f"Response Answer: {response_ans}", args.mode)
-                token_usage = extract_token_usage(response)
-                log_line(log_file, f"Token Usage: {token_usage}", args.mode)
-
-                if response_text is None:
-                    log_line(log_file, f"⚠️ No response text found.", args.mode)
-                    retry_count += 1
-                    continue
-                if response_ans is None:
-                    log_line(log_file, f"⚠️ No answer found in response.", args.mode)
-                    retry_count += 1
-                    continue
-
-                success = True
-                break
-
-            except Exception as e:
-                log_line(log_file, f"⚠️ Exception parsing response: {e}", args.mode)
-                retry_count += 1
-                continue
-
-        if not success:
-            error_indices.append(idx)
-            continue
-
-        correct = response_ans == answer
-        data = {
-            "index": idx,
-            "question": question,
-            "choices": choices,
-            "answer": answer,
-            "response_ans": response_ans,
-            "correct": correct,
-            "prompt": prompt,
-            "response": response_text,
-            "time_usage": elapsed_time,
-            "token_usage": token_usage,
-        }
-
-        if args.mode == "run":
-            dump_json(data, output_file)
-
-        log_line(log_file, f"Response: {response_text}", args.mode)
-        log_line(log_file, f"Response Answer: {response_ans}", args.mode)
-        log_line(log_file, f"Correct: {correct}", args.mode)
-        log_line(log_file, f"Timing Info: {elapsed_time:.2f}s", args.mode)
-        log_line(log_file, f"Token Usage: {token_usage}", args.mode)
-
-    if error_indices:
-        log_line(error_log_file, f"Error Indices: {error_indices}", args.mode)
-    else:
-        print("No errors encountered.")
+    try:
+        if args.mode == "batch":
+            for shard in shards:
+                shard.error_indices = run_batch(shard.args, key_pool, shard.work_items, shard.output, shard.log_file, shard.output_file)
+        elif args.concurrency > 1 or len(key_pool.keys) > 1 or len(shards) > 1:
+            print(f"⚡ Running {args.concurrency} concurrent request(s) on each of {len(key_pool.keys)} key(s)")
+            asyncio.run(run_concurrent(args, key_pool, response_cache, shards))
+        else:
+            shard = shards[0]
+            client = get_client(args.provider, key_pool.keys[0], args.base_url)
+            limiter = RateLimiter(args.rpm, args.tpm)
+            metrics = METRICS.bind(key=key_pool.keys[0], provider=args.provider, model=request_model_name(shard.args))
+            for i, item in enumerate(tqdm(shard.work_items, desc=f"Running {shard.args.prompt}")):
+                if SPEND.exhausted():
+                    shard.error_indices.extend(it[0] for it in shard.work_items[i:])
+                    break
+                status = run_sample(client, limiter, response_cache, shard.args, item, shard.output, shard.log_file, metrics)
+                if status == "quota":
+                    # The only key is unusable: the rest goes to the error index log
+                    key_pool.retire(key_pool.keys[0], "quota error")
+                    shard.error_indices.extend(it[0] for it in shard.work_items[i:])
+                    break
+                if status == "failed":
+                    shard.error_indices.append(item[0])
+
+        for shard in shards:
+            shard.finish()
+
+        for line in METRICS.summary_lines():
+            print(f"📈 {line}")
+        for line in SPEND.summary_lines():
+            print(f"💰 {line}")
+        if SPEND.exhausted():
+            print("🛑 Spend cap reached: unscheduled items were logged as error indices")
+    finally:
+        # Also on Ctrl-C or an error: everything recorded so far is flushed and
+        # covered by the completion checkpoint, so --resume picks up from there
+        for shard in shards:
+            shard.output.close()
+        if metrics_exporter:
+            metrics_exporter.stop()
+        if metrics_server:
+            metrics_server.shutdown()
+        if response_cache:
+            print(f"💾 Cache stats: {response_cache.stats()}")
+            response_cache.close()
+        writer.close()
 
-    log_file.close()
-    error_log_file.close()
+def run_experiment(args):
+    run_shards(args, [args])
 
 # ====== Entry Point ======
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Run LLM with different reasoning prompts.")
+def build_parser(description="Run LLM with different reasoning prompts."):
+    parser = argparse.ArgumentParser(description=description)
     parser.add_argument("--prompt", type=str, default="standard", choices=prompt_map.keys())
     parser.add_argument("--model", type=str, default="Qwen/Qwen3-235B-A22B-fp8-tput")
-    parser.add_argument("--api_key", type=str)
+    parser.add_argument("--api_key", type=str, nargs="+", help="Env var name(s) of the API key(s); several keys share one work queue")
+    parser.add_argument("--key_pattern", type=str, help=r"Use every env var matching this regex as a key (e.g. 'together_\d+')")
     parser.add_argument("--start", type=int, default=0)
     parser.add_argument("--end", type=int, default=14042)
-    parser.add_argument("--mode", type=str, default="run", choices=["run", "test"])
+    parser.add_argument("--mode", type=str, default="run", choices=["run", "test", "batch"], help="batch: submit all prompts as one provider batch job (cheaper, hours of turnaround)")
     parser.add_argument("--shard_id", type=int, required=True)
     parser.add_argument("--fill_missing", type=str, help="Prompt name to fill missing indices from log/missing_lists")
     parser.add_argument("--folder", type=str, default="20256666")
     parser.add_argument("--stream", action="store_true", help="Use streaming response from model")
-    parser.add_argument("--provider", type=str, choices=["together", "gemini", "nvidia"], required=True, help="Choose model provider: together or gemini")
+    parser.add_argument("--provider", type=str, choices=list(PROVIDERS), required=True, help="Model provider (see inference/providers); vllm = a self-hosted OpenAI-compatible server")
+    parser.add_argument("--base_url", type=str, help="Override the provider API endpoint (e.g. a local mock server or vLLM)")
     parser.add_argument("--indices", type=str, help="Comma-separated index list (e.g. 100,102,105)")
+    parser.add_argument("--rpm", type=float, help="Requests-per-minute budget per key (learned from 429s if omitted)")
+    parser.add_argument("--tpm", type=float, help="Tokens-per-minute budget per key")
+    parser.add_argument("--prompt_cache_dir", type=str, help="Persist rendered prompts per prompt type as Parquet here and reuse them (e.g. cache/prompts)")
+    parser.add_argument("--resume", action="store_true", help="Skip indices already recorded in this shard's checkpoint/output")
+    parser.add_argument("--cache_mode", type=str, default="off", choices=CACHE_MODES, help="read: reuse cached responses and store new ones, write: refresh the cache, off: disable")
+    parser.add_argument("--cache_path", type=str, default="cache/responses.sqlite")
+    parser.add_argument("--cache_max_mb", type=float, default=2048, help="Size cap of the response cache (LRU eviction)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests kept in flight per key via the async clients (1 with one key = sequential loop)")
+    parser.add_argument("--early_stop", action="store_true", help="With --stream, close the stream once the final answer appears after </think>")
+    parser.add_argument("--results_format", type=str, default="jsonl", choices=RESULTS_FORMATS, help="Shard output as JSONL, compact Parquet parts (no question/choices/prompt copies), or both")
+    parser.add_argument("--metrics_port", type=int, help="Serve live metrics (Prometheus text at /metrics, JSON at /metrics.json) on this local port")
+    parser.add_argument("--metrics_path", type=str, help="Append JSONL metric snapshots here while running (e.g. log/metrics.jsonl)")
+    parser.add_argument("--metrics_interval", type=float, default=10.0, help="Seconds between JSONL metric snapshots")
+    parser.add_argument("--write_batch", type=int, default=256, help="Flush output/log writes once this many are queued")
+    parser.add_argument("--write_interval", type=float, default=1.0, help="Flush output/log writes at least this often (seconds)")
+    parser.add_argument("--retry_budget", type=str, nargs="*", help="Per-cause retry budgets as CAUSE=N (e.g. no_answer=0 timeout=5); see inference/retry_policy.py")
+    parser.add_argument("--max_tokens", type=int, help="Completion token budget per request (default: the provider's)")
+    parser.add_argument("--max_tokens_from", type=str, nargs="*", help="Derive max_tokens per prompt from earlier results in these folders (e.g. output temp/20250430): p99 + margin")
+    parser.add_argument("--max_tokens_margin", type=float, default=0.2, help="Headroom over the historical p99 for --max_tokens_from")
+    parser.add_argument("--token_budget_path", type=str, default="cache/token_budgets.json", help="Cached completion-token stats behind --max_tokens_from")
+    parser.add_argument("--price", type=float, nargs=2, metavar=("IN", "OUT"), help="USD per million prompt/completion tokens (default: inference/token_budget.py PRICES)")
+    parser.add_argument("--max_spend", type=float, help="Stop scheduling new requests once the estimated spend reaches this many USD")
+    parser.add_argument("--dedup", action="store_true", help="Copy in items already answered (same prompt text, model, sampling params, max_tokens, early stop) in any result file under --dedup_roots instead of calling the API")
+    parser.add_argument("--dedup_roots", type=str, nargs="+", default=["temp", "output"], help="Folders whose result files are indexed for --dedup")
+    parser.add_argument("--dedup_index", type=str, default="cache/dedup_index.sqlite", help="Persistent index behind --dedup")
+    parser.add_argument("--batch_backend", type=str, default="provider", choices=["provider", "local"], help="--mode batch: the provider's batch API, or a local file-based stand-in under --batch_dir")
+    parser.add_argument("--batch_dir", type=str, default="cache/batches", help="Batch input files, job state and local batches")
+    parser.add_argument("--batch_poll", type=float, default=60.0, help="Seconds between batch status polls")
+    return parser
 
-    
-    args = parser.parse_args()
-
+if __name__ == "__main__":
+    args = build_parser().parse_args()
     run_experiment(args)
@@ -0,0 +1,37 @@
+import argparse
+from main import build_parser, run_shards
+from inference.work_items import load_columns, load_mmlu_test
+from prompts.prompts import prompt_map
+
+# ====== Sweep ======
+# Runs several prompt types (and models) in one process: the dataset is loaded
+# and converted once, and every (prompt, model, index) work item goes through
+# the same key pool and worker queue, interleaved so all prompts progress
+# together. Outputs are the usual per-prompt shard files.
+
+def model_slug(model):
+    return model.split("/")[-1]
+
+def sweep_args(args, prompts, models):
+    # One argparse namespace per shard; several models get a folder each
+    # ({folder}_{model}), since shard file names do not include the model
+    shard_args = []
+    for model in models:
+        folder = args.folder if len(models) == 1 else f"{args.folder}_{model_slug(model)}"
+        for prompt in prompts:
+            shard_args.append(argparse.Namespace(**dict(vars(args), prompt=prompt, model=model, folder=folder)))
+    return shard_args
+
+if __name__ == "__main__":
+    parser = build_parser("Run several prompt types and models as one sweep.")
+    parser.add_argument("--prompts", type=str, nargs="+", choices=prompt_map.keys(), help="Prompt types to run")
+    parser.add_argument("--all", action="store_true", help="Run every prompt in prompt_map")
+    parser.add_argument("--models", type=str, nargs="+", help="Models to run (default: --model)")
+    args = parser.parse_args()
+
+    prompts = list(prompt_map) if args.all else (args.prompts or [args.prompt])
+    models = args.models or [args.model]
+    print(f"🧹 Sweep: {len(prompts)} prompt(s) x {len(models)} model(s), shard {args.shard_id}")
+
+    test_split = load_mmlu_test()
+    run_shards(args, sweep_args(args, prompts, models), test_split, load_columns(test_split))
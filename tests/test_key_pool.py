@@ -0,0 +1,34 @@
+from google.genai import errors
+from inference.key_pool import is_quota_error
+
+# Verbatim shape of Gemini's per-minute free-tier 429
+GEMINI_RATE_LIMIT = {"error": {
+    "code": 429,
+    "message": "You exceeded your current quota, please check your plan and billing details. For more "
+               "information on this error, head to: https://ai.google.dev/gemini-api/docs/rate-limits.",
+    "status": "RESOURCE_EXHAUSTED",
+    "details": [
+        {"@type": "type.googleapis.com/google.rpc.QuotaFailure",
+         "violations": [{"quotaMetric": "generativelanguage.googleapis.com/generate_content_free_tier_requests",
+                         "quotaId": "GenerateRequestsPerMinutePerProjectPerModel-FreeTier",
+                         "quotaDimensions": {"location": "global", "model": "gemini-2.0-flash"},
+                         "quotaValue": "15"}]},
+        {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "41s"},
+    ],
+}}
+
+def test_gemini_rate_limit_keeps_key():
+    assert not is_quota_error(errors.ClientError(429, GEMINI_RATE_LIMIT))
+
+def test_credit_exhaustion_retires_key():
+    assert is_quota_error("Error code: 429 - {'error': {'code': 'insufficient_quota'}}")
+    assert is_quota_error("Error code: 402 - Payment Required: credit limit reached")
+
+def test_auth_failure_retires_key():
+    assert is_quota_error("Error code: 401 - {'error': {'message': 'Invalid API key'}}")
+    assert is_quota_error(errors.ClientError(400, {"error": {"code": 400, "message": "API key not valid.", "status": "INVALID_ARGUMENT"}}))
+
+def test_plain_errors_keep_key():
+    assert not is_quota_error(None)
+    assert not is_quota_error("Error code: 503 - Service Unavailable")
+    assert not is_quota_error("Error code: 429 - Too Many Requests")
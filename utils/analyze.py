@@ -1,23 +1,133 @@
 import os
 import re
 import json
+import hashlib
 import argparse
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from array import array
 from collections import defaultdict
-from datasets import load_dataset
+from concurrent.futures import ProcessPoolExecutor
+from mmlu_index import load_index, load_subject_map
+from results_io import find_results, iter_records, list_result_names
 # from scipy.stats import wilcoxon
 # from statsmodels.stats.contingency_tables import mcnemar
 
-# Load MMLU dataset
-ds = load_dataset("cais/mmlu", "all")
-subject_map = {i: ds['test'][i]['subject'] for i in range(len(ds['test']))}
+# MMLU subject index, built on first use from the cached cache/mmlu_index file
+subject_map = None
+subject_index = None
+
+def get_subject_map(rebuild=False):
+    global subject_map
+    if subject_map is None or rebuild:
+        subject_map = load_subject_map(rebuild=rebuild)
+    return subject_map
+
+def get_subject_index():
+    # (subject names, per-dataset-index subject code) for vectorised grouping
+    global subject_index
+    if subject_index is None:
+        index = load_index()
+        subject_index = (index["subject_names"].tolist(), index["subject_codes"].astype(np.int64))
+    return subject_index
+
+# === Single-pass metric scan ===
+THINK_PATTERN = re.compile(r"<think>(.*?)</think>", flags=re.DOTALL)
+
+def scan_output(path):
+    # Streams one *_output.json/.parquet and keeps only compact per-record columns, so memory
+    # does not grow with response length and each file is parsed exactly once.
+    # -1 marks a missing value in the integer columns.
+    cols = {
+        "index": array("l"), "correct": array("b"), "ans_missing": array("b"), "response_missing": array("b"),
+        "total_words": array("l"), "think_words": array("l"), "wait_tokens": array("l"),
+        "completion_tokens": array("l"), "latency": array("d"),
+    }
+    for item in iter_records(path):
+        idx = item.get("index")
+        response = item.get("response", "")
+        correct_flag = item.get("correct")
 
-# === File utilities ===
-def load_jsonl_to_list(path):
+        think_words = -1
+        if response and "<think>" in response and "</think>" in response:
+            think_words = sum(len(block.split()) for block in THINK_PATTERN.findall(response))
+
+        cols["index"].append(idx if idx is not None else -1)
+        cols["correct"].append(-1 if correct_flag is None else int(bool(correct_flag)))
+        cols["ans_missing"].append(item.get("response_ans") is None)
+        cols["response_missing"].append(response is None)
+        cols["total_words"].append(len(response.split()) if response else 0)
+        cols["think_words"].append(think_words)
+        cols["wait_tokens"].append(response.lower().count("wait") if response else 0)
+        cols["completion_tokens"].append((item.get("token_usage") or {}).get("completion", 0) or 0)
+        cols["latency"].append(item.get("time_usage", 0) or 0)
+    return {name: np.array(col, dtype=col.typecode) for name, col in cols.items()}
+
+# === Incremental cache ===
+# {stats}/cache holds a manifest of output-file fingerprints plus, per prompt, the
+# scanned metric columns (.npz) and the summary/subject/flip aggregates (.json).
+def file_fingerprint(path, previous=None):
+    # Content hash is only recomputed when size or mtime moved
+    st = os.stat(path)
+    if previous and previous.get("size") == st.st_size and previous.get("mtime_ns") == st.st_mtime_ns:
+        return previous
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest.hexdigest()}
+
+def load_manifest(cache_folder):
+    path = f"{cache_folder}/manifest.json"
+    if not os.path.exists(path):
+        return {"files": {}, "prompts": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, cache_folder):
+    os.makedirs(cache_folder, exist_ok=True)
+    tmp_path = f"{cache_folder}/manifest.json.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, f"{cache_folder}/manifest.json")
+
+def load_or_scan_metrics(path, name, cache_folder, reuse):
+    cache_path = f"{cache_folder}/{name}_metrics.npz"
+    if reuse and os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            return {key: data[key] for key in data.files}
+    metrics = scan_output(path)
+    os.makedirs(cache_folder, exist_ok=True)
+    np.savez(cache_path, **metrics)
+    return metrics
+
+def save_aggregates(name, summary, flip_stats, subject_stats, cache_folder):
+    os.makedirs(cache_folder, exist_ok=True)
+    with open(f"{cache_folder}/{name}_aggregates.json", "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "subject_stats": subject_stats, "flip_stats": flip_stats}, f)
+
+def load_aggregates(name, cache_folder):
+    path = f"{cache_folder}/{name}_aggregates.json"
+    if not os.path.exists(path):
+        return None
     with open(path, "r", encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
+        return json.load(f)
+
+def correctness_by_index(metrics):
+    # Dense array: 1/0 per dataset index, -1 where the output has no verdict
+    size = max(len(get_subject_map()), int(metrics["index"].max(initial=-1)) + 1)
+    dense = np.full(size, -1, dtype=np.int8)
+    known = (metrics["index"] >= 0) & (metrics["correct"] >= 0)
+    dense[metrics["index"][known]] = metrics["correct"][known]
+    return dense
+
+def subject_codes_for(indices):
+    # Subject code per dataset index; indices outside the dataset map to an extra "Unknown" code
+    names, codes = get_subject_index()
+    in_range = (indices >= 0) & (indices < len(codes))
+    return np.where(in_range, codes[np.clip(indices, 0, len(codes) - 1)], len(names)), names + ["Unknown"]
 
 # === Save per-subject flip stats ===
 def save_flip_subject_csv(flip_subject_stats, output_path):
@@ -73,31 +183,24 @@ def plot_flip_subjects(df, prompt_name, plot_folder):
 #     plt.close()
 
 # === Plot scatter: baseline vs. prompt word count ===
-def plot_wordcount_scatter(baseline_file, prompt_file, prompt_name, plot_folder):
-    base_data = load_jsonl_to_list(baseline_file)
-    prompt_data = load_jsonl_to_list(prompt_file)
-
-    def get_word_map(data):
-        return {
-            item["index"]: len(item.get("response", "").split())
-            for item in data if item.get("index") is not None
-        }
-
-    base_map = get_word_map(base_data)
-    prompt_map = get_word_map(prompt_data)
-
-    rows = []
-    for idx in sorted(set(base_map) & set(prompt_map)):
-        rows.append({
-            "index": idx,
-            "baseline_total": base_map[idx],
-            "prompt_total": prompt_map[idx],
-        })
-    df = pd.DataFrame(rows)
+def plot_wordcount_scatter(base_metrics, prompt_metrics, prompt_name, plot_folder):
+    def get_word_map(metrics):
+        has_index = metrics["index"] >= 0
+        return dict(zip(metrics["index"][has_index].tolist(), metrics["total_words"][has_index].tolist()))
+
+    base_map = get_word_map(base_metrics)
+    prompt_map = get_word_map(prompt_metrics)
+
+    shared = sorted(set(base_map) & set(prompt_map))
+    df = pd.DataFrame({
+        "index": shared,
+        "baseline_total": [base_map[idx] for idx in shared],
+        "prompt_total": [prompt_map[idx] for idx in shared],
+    })
 
     plt.figure(figsize=(18, 10))
     sns.scatterplot(data=df, x="baseline_total", y="prompt_total", alpha=0.5)
-    sns.regplot(data=df, x="baseline_total", y="prompt_total", scatter=False, color="red")
+    sns.regplot(data=df, x="baseline_total", y="prompt_total", scatter=False, color="red", seed=0)
 
     plt.gca().set_aspect('equal', adjustable='box')  # 👈 Add this line for equal scaling
 
@@ -149,63 +252,69 @@ def analyze_missing_by_subject(prompt_name, index_missing_list, response_missing
         plt.savefig(f"{missing_plot_dir}/{prompt_name}_{miss_type}_bar.png")
         plt.close()
 
-# === Main analysis logic ===
-def analyze_single_output(prompt_name, data, baseline_map, stats_folder, missing_folder):
-    total = correct = think_word_count = think_count = think_response_count = wait_token_count = total_word_count = total_latency = completion_tokens = 0
-    index_missing_list = response_ans_missing_list = response_missing_list = []
-    output_all_index = set(item.get("index") for item in data if item.get("index") is not None)
-    dataset_all_index = set(range(len(ds['test'])))
-
-    subject_stats = defaultdict(lambda: {"total": 0, "correct": 0})
-    flip_subject_stats = defaultdict(lambda: {
-        "flip_success": 0, "flip_failure": 0,
-        "stay_correct": 0, "backfire": 0
-    })
-
-    index_missing_list = list(dataset_all_index - output_all_index)
+# === Console summary ===
+def format_summary(summary):
+    return "\n".join([
+        f"\n📊 Prompt Summary: {summary['Prompt']}",
+        "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
+        f"🧮 Total Questions       : {summary['Total']:>5}",
+        f"✅ Correct               : {summary['Total_correct']:>5}",
+        f"🎯 Accuracy              : {summary['Accuracy']:.2%}",
+        "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
+        f"📝 Avg. Words            : {summary['Total_words_avg']:>5}",
+        f"🧠 Avg. <think> Words    : {summary['Think_words_avg']:>5}",
+        f"⏳ Total Latency (s)     : {summary['Time(s)']:>5}",
+        "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
+        f"⏳ Total 'wait' tokens   : {summary['Total_wait_tokens']:>5}",
+        f"⏱️ Avg. 'wait' per Q     : {summary['Wait_tokens_avg']:>5}",
+        "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
+        f"🟩 Flip Success          : {summary['Flip_success']:>5}",
+        f"🟦 Flip Failure          : {summary['Flip_failure']:>5}",
+        f"⬜ Stay Correct          : {summary['Stay_correct']:>5}",
+        f"🟥 Backfire              : {summary['Backfire']:>5}",
+        "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
+        f"❗ Index Missing         : {len(summary['Index_missing_list']):>5}",
+        f"❗ Response Missing      : {len(summary['Response_missing_list']):>5}",
+        f"❗ Answer Missing        : {len(summary['Response_ans_missing_list']):>5}",
+        "==================================================\n",
+    ])
 
-    for item in data:
-        idx = item.get("index")
-        response = item.get("response", "")
-        response_ans = item.get("response_ans")
-        correct_flag = item.get("correct")
-
-        total += 1
-        if correct_flag:
-            correct += 1
-
-        if "<think>" in response and "</think>" in response:
-            think_count += 1
-            think_blocks = re.findall(r"<think>(.*?)</think>", response, flags=re.DOTALL)
-            words = sum(len(block.strip().split()) for block in think_blocks)
-            think_word_count += words
-            if words > 0:
-                think_response_count += 1
-
-        if response_ans is None:
-            response_ans_missing_list.append(idx)
-        if response is None:
-            response_missing_list.append(idx)
-
-        wait_token_count += response.lower().count("wait")
-        total_word_count += len(response.split())
-        completion_tokens += item.get("token_usage", {}).get("completion", 0)
-        total_latency += item.get("time_usage", 0)
-
-        subj = subject_map.get(idx, "Unknown")
-        subject_stats[subj]["total"] += 1
-        subject_stats[subj]["correct"] += int(correct_flag)
-
-        if baseline_map and idx in baseline_map and correct_flag is not None:
-            baseline_correct = baseline_map[idx]
-            if not baseline_correct and correct_flag:
-                flip_subject_stats[subj]["flip_success"] += 1
-            elif not baseline_correct and not correct_flag:
-                flip_subject_stats[subj]["flip_failure"] += 1
-            elif baseline_correct and correct_flag:
-                flip_subject_stats[subj]["stay_correct"] += 1
-            elif baseline_correct and not correct_flag:
-                flip_subject_stats[subj]["backfire"] += 1
+# === Main analysis logic ===
+FLIP_KINDS = ["flip_failure", "flip_success", "backfire", "stay_correct"]  # baseline_correct * 2 + correct
+
+def analyze_single_output(prompt_name, metrics, baseline_correct, stats_folder, missing_folder, plot_folder):
+    subject_map = get_subject_map()
+    idx = metrics["index"]
+    correct_col = metrics["correct"]
+    total = len(idx)
+    correct = int((correct_col == 1).sum())
+    think_blocks = metrics["think_words"][metrics["think_words"] >= 0]
+    think_word_count = int(think_blocks.sum())
+    think_response_count = int((think_blocks > 0).sum())
+    wait_token_count = int(metrics["wait_tokens"].sum())
+    total_word_count = int(metrics["total_words"].sum())
+    total_latency = float(metrics["latency"].sum())
+
+    index_missing_list = sorted(set(range(len(subject_map))) - set(idx[idx >= 0].tolist()))
+    response_ans_missing_list = [i if i >= 0 else None for i in idx[metrics["ans_missing"] == 1].tolist()]
+    response_missing_list = [i if i >= 0 else None for i in idx[metrics["response_missing"] == 1].tolist()]
+
+    codes, subject_names = subject_codes_for(idx)
+    subject_stats = {}
+    subject_totals = np.bincount(codes, minlength=len(subject_names))
+    subject_correct = np.bincount(codes, weights=(correct_col == 1), minlength=len(subject_names))
+    for code in np.flatnonzero(subject_totals):
+        subject_stats[subject_names[code]] = {"total": int(subject_totals[code]), "correct": int(subject_correct[code])}
+
+    flip_subject_stats = {}
+    if baseline_correct is not None:
+        in_baseline = (idx >= 0) & (idx < len(baseline_correct)) & (correct_col >= 0)
+        in_baseline[in_baseline] = baseline_correct[idx[in_baseline]] >= 0
+        kinds = baseline_correct[idx[in_baseline]].astype(np.int64) * 2 + correct_col[in_baseline]
+        counts = np.zeros((len(subject_names), len(FLIP_KINDS)), dtype=np.int64)
+        np.add.at(counts, (codes[in_baseline], kinds), 1)
+        for code in np.flatnonzero(counts.sum(axis=1)):
+            flip_subject_stats[subject_names[code]] = {kind: int(counts[code, k]) for k, kind in enumerate(FLIP_KINDS)}
 
     summary = {
         "Prompt": prompt_name,
@@ -225,31 +334,6 @@ def analyze_single_output(prompt_name, data, baseline_map, stats_folder, missing
         "Response_missing_list": response_missing_list,
         "Response_ans_missing_list": response_ans_missing_list
     }
-    
-    # log all the info
-    print(f"\n📊 Prompt Summary: {prompt_name}")
-    print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-    print(f"🧮 Total Questions       : {total:>5}")
-    print(f"✅ Correct               : {correct:>5}")
-    print(f"🎯 Accuracy              : {summary['Accuracy']:.2%}")
-    print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-    print(f"📝 Avg. Words            : {summary['Total_words_avg']:>5}")
-    print(f"🧠 Avg. <think> Words    : {summary['Think_words_avg']:>5}")
-    print(f"⏳ Total Latency (s)     : {summary['Time(s)']:>5}")
-    print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-    print(f"⏳ Total 'wait' tokens   : {summary['Total_wait_tokens']:>5}")
-    print(f"⏱️ Avg. 'wait' per Q     : {summary['Wait_tokens_avg']:>5}")
-    print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-    print(f"🟩 Flip Success          : {summary['Flip_success']:>5}")
-    print(f"🟦 Flip Failure          : {summary['Flip_failure']:>5}")
-    print(f"⬜ Stay Correct          : {summary['Stay_correct']:>5}")
-    print(f"🟥 Backfire              : {summary['Backfire']:>5}")
-    print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-    print(f"❗ Index Missing         : {len(summary['Index_missing_list']):>5}")
-    print(f"❗ Response Missing      : {len(summary['Response_missing_list']):>5}")
-    print(f"❗ Answer Missing        : {len(summary['Response_ans_missing_list']):>5}")
-    print("==================================================\n")
-
 
     os.makedirs(missing_folder, exist_ok=True)
     with open(f"{missing_folder}/{prompt_name}_missing.json", "w", encoding="utf-8") as f:
@@ -273,16 +357,42 @@ def analyze_single_output(prompt_name, data, baseline_map, stats_folder, missing
 
     pd.DataFrame([summary]).to_csv(f"{stats_folder}/{prompt_name}_stats.csv", index=False)
 
-    return {item["index"]: item["correct"] for item in data if item.get("correct") is not None}, flip_subject_stats
+    return correctness_by_index(metrics), flip_subject_stats, summary, subject_stats
+
+# === Per-prompt work (runs in the pool when --workers > 1) ===
+baseline_metrics = baseline_correct = None
+
+def init_worker(shared_baseline_metrics, shared_baseline_correct):
+    global baseline_metrics, baseline_correct
+    baseline_metrics, baseline_correct = shared_baseline_metrics, shared_baseline_correct
+    plt.switch_backend("Agg")
+
+def analyze_prompt(name, reuse_metrics, folder, plot_folder, stats_folder, flip_csv_folder, missing_folder, cache_folder):
+    path = find_results(folder, f"{name}_output")
+    metrics = load_or_scan_metrics(path, name, cache_folder, reuse_metrics)
+    _, flip_stats, summary, subject_stats = analyze_single_output(name, metrics, baseline_correct, stats_folder, missing_folder, plot_folder)
+    save_aggregates(name, summary, flip_stats, subject_stats, cache_folder)
+
+    csv_path = f"{flip_csv_folder}/{name}_flip.csv"
+    df = save_flip_subject_csv(flip_stats, csv_path)
+    plot_flip_subjects(df, name, plot_folder)
+    plot_wordcount_scatter(baseline_metrics, metrics, name, plot_folder)
+    return format_summary(summary)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--i", type=str, nargs="*", help="Prompt name(s) without _output.json")
+    parser.add_argument("--i", type=str, nargs="*", help="Prompt name(s) without _output.json/_output.parquet")
     parser.add_argument("--all", action="store_true", help="Analyze all prompts")
     parser.add_argument("--folder", type=str, default="output", help="Folder containing outputs")
     parser.add_argument("--mode", type=str, choices=["run", "test"], default="run", help="Mode: run or test")
+    parser.add_argument("--incremental", action="store_true", help="Only recompute prompts whose output (or the baseline) changed since the last analysis")
+    parser.add_argument("--workers", type=int, default=1, help="Analyze prompts in parallel with this many processes")
+    parser.add_argument("--rebuild_index", action="store_true", help="Rebuild the cached MMLU subject index from the dataset")
     args = parser.parse_args()
 
+    if args.rebuild_index:
+        get_subject_map(rebuild=True)
+
     # Folder setup
     plot_folder = f"{args.folder}/plots" if args.mode == "run" else f"{args.folder}/plots_test"
     stats_folder = f"{args.folder}/stats"
@@ -293,24 +403,60 @@ if __name__ == "__main__":
     os.makedirs(flip_csv_folder, exist_ok=True)
 
     # Baseline
-    files = os.listdir(args.folder)
-    if "standard_output.json" not in files:
-        raise FileNotFoundError("❌ standard_output.json not found in specified folder.")
-
-    baseline_path = os.path.join(args.folder, "standard_output.json")
-    baseline_data = load_jsonl_to_list(baseline_path)
-    baseline_map, _ = analyze_single_output("standard", baseline_data, {}, stats_folder, missing_folder)
-
-    input_files = [f.replace("_output.json", "") for f in files if f.endswith("_output.json") and f != "standard_output.json"] if args.all else args.i
+    names = list_result_names(args.folder)
+    if "standard" not in names:
+        raise FileNotFoundError("❌ standard_output.json (or .parquet) not found in specified folder.")
+
+    baseline_path = find_results(args.folder, "standard_output")
+    cache_folder = f"{stats_folder}/cache"
+    manifest = load_manifest(cache_folder)
+    previous_files = manifest["files"]
+
+    baseline_fp = file_fingerprint(baseline_path, previous_files.get("standard"))
+    baseline_same = previous_files.get("standard", {}).get("sha256") == baseline_fp["sha256"]
+    cached_baseline = load_aggregates("standard", cache_folder) if args.incremental and baseline_same else None
+    shared_metrics = load_or_scan_metrics(baseline_path, "standard", cache_folder, args.incremental and baseline_same)
+    if cached_baseline:
+        shared_correct = correctness_by_index(shared_metrics)
+        print("⏭️ standard: unchanged, reusing cached results")
+        print(format_summary(cached_baseline["summary"]))
+    else:
+        shared_correct, _, baseline_summary, baseline_subjects = analyze_single_output("standard", shared_metrics, None, stats_folder, missing_folder, plot_folder)
+        save_aggregates("standard", baseline_summary, {}, baseline_subjects, cache_folder)
+        print(format_summary(baseline_summary))
+    manifest["files"]["standard"] = baseline_fp
+
+    input_files = [name for name in names if name != "standard"] if args.all else args.i
     if not input_files:
         raise ValueError("Please provide --i or --all")
 
+    # With --incremental, a prompt is skipped when neither its output nor the baseline changed
+    jobs = []
     for name in input_files:
-        path = os.path.join(args.folder, f"{name}_output.json")
-        data = load_jsonl_to_list(path)
-        correct_map, flip_stats = analyze_single_output(name, data, baseline_map, stats_folder, missing_folder)
-
-        csv_path = f"{flip_csv_folder}/{name}_flip.csv"
-        df = save_flip_subject_csv(flip_stats, csv_path)
-        plot_flip_subjects(df, name, plot_folder)
-        plot_wordcount_scatter(baseline_path, path, name, plot_folder)
+        fp = file_fingerprint(find_results(args.folder, f"{name}_output"), previous_files.get(name))
+        output_same = previous_files.get(name, {}).get("sha256") == fp["sha256"]
+        manifest["files"][name] = fp
+        state = {"output": fp["sha256"], "baseline": baseline_fp["sha256"], "plots": plot_folder}
+        cached = load_aggregates(name, cache_folder) if args.incremental and manifest["prompts"].get(name) == state else None
+        if cached:
+            print(f"⏭️ {name}: unchanged, reusing cached results")
+            print(format_summary(cached["summary"]))
+        else:
+            jobs.append((name, args.incremental and output_same, state))
+
+    # Results come back in input order, so the console output matches the serial run
+    folders = (args.folder, plot_folder, stats_folder, flip_csv_folder, missing_folder, cache_folder)
+    if args.workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(shared_metrics, shared_correct)) as pool:
+            futures = [pool.submit(analyze_prompt, name, reuse, *folders) for name, reuse, _ in jobs]
+            for future, (name, _, state) in zip(futures, jobs):
+                print(future.result())
+                manifest["prompts"][name] = state
+    else:
+        init_worker(shared_metrics, shared_correct)
+        for name, reuse, state in jobs:
+            print(analyze_prompt(name, reuse, *folders))
+            manifest["prompts"][name] = state
+
+    save_manifest(manifest, cache_folder)
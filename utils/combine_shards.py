@@ -1,30 +1,26 @@
 import os
-import json
 import argparse
 from glob import glob
+from results_io import RESULTS_FORMATS
+from shard_merge import DUPLICATE_POLICIES, merge_files
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--prompt", type=str, required=True)
 parser.add_argument("--date", type=str, required=True)  # e.g. 20250422
 parser.add_argument("--outdir", type=str, default="output")
+parser.add_argument("--format", type=str, default="jsonl", choices=RESULTS_FORMATS[:2], help="Format of the combined file")
+parser.add_argument("--policy", type=str, default="latest", choices=DUPLICATE_POLICIES, help="Which record to keep when shards repeat an index")
+parser.add_argument("--run_size", type=int, default=5000, help="Records per in-memory sorted run for unordered shards")
 args = parser.parse_args()
 
-shard_files = sorted(glob(f"temp/{args.date}/{args.prompt}_shard*.json"))
-combined = []
+# A shard run with --results_format both has a .json and a .parquet copy; read the Parquet one
+shard_files = {}
+for fname in sorted(glob(f"temp/{args.date}/{args.prompt}_shard*.json")) + sorted(glob(f"temp/{args.date}/{args.prompt}_shard*.parquet")):
+    shard_files[os.path.splitext(fname)[0]] = fname
+shard_files = sorted(shard_files.values())
 
-for fname in shard_files:
-    with open(fname, 'r', encoding='utf-8') as f:
-        for line in f:
-            combined.append(json.loads(line))
+# Streaming k-way merge by index
+output_path = f"{args.outdir}/{args.prompt}_combined.{'parquet' if args.format == 'parquet' else 'json'}"
+total = merge_files(shard_files, output_path, args.policy, args.run_size)
 
-# Sorted by index
-combined = sorted(combined, key=lambda x: x.get("index", 0))
-
-# Save combined output
-os.makedirs(args.outdir, exist_ok=True)
-output_path = f"{args.outdir}/{args.prompt}_combined.json"
-with open(output_path, 'w', encoding='utf-8') as f:
-    for item in combined:
-        f.write(json.dumps(item, ensure_ascii=False) + "\n")
-
-print(f"✅ Combined {len(shard_files)} shard files → {output_path}")
+print(f"✅ Combined {len(shard_files)} shard files → {output_path} ({total} items)")
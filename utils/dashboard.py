@@ -0,0 +1,233 @@
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from glob import glob
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SHARD_PATTERN = re.compile(r"^(?P<prompt>.+)_shard(?P<shard>\d+)\.(?:json|log|parquet)$")
+RATE_WINDOW = 300  # seconds of history behind requests/min and tokens/min
+
+# === Incremental file tailing ===
+class FileTail:
+    # Remembers how far a file was read; each poll only reads the bytes appended
+    # since, and holds back a trailing partial line until it is complete.
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = b""
+
+    def read_lines(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return []
+        if size < self.offset:  # truncated or rewritten: start over
+            self.offset, self.partial = 0, b""
+        if size == self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = self.partial + f.read(size - self.offset)
+        self.offset = size
+        lines = data.split(b"\n")
+        self.partial = lines.pop()
+        return lines
+
+# === Per-prompt aggregation ===
+class PromptStats:
+    def __init__(self, total):
+        self.total = total
+        self.correct_by_index = {}
+        self.records = 0
+        self.tokens = 0
+        self.api_errors = 0
+        self.attempts = 0
+        self.shards = set()
+        self.history = deque()  # (time, records, tokens)
+
+    def add_record(self, item):
+        self.records += 1
+        self.attempts += 1
+        self.tokens += max(0, ((item.get("token_usage") or {}).get("completion") or 0))
+        if item.get("index") is not None:
+            self.correct_by_index[item["index"]] = bool(item.get("correct"))
+
+    def add_log_line(self, line):
+        if line.startswith("⚠️ API Error"):
+            self.api_errors += 1
+            self.attempts += 1
+
+    def tick(self, now):
+        self.history.append((now, self.records, self.tokens))
+        while len(self.history) > 2 and now - self.history[0][0] > RATE_WINDOW:
+            self.history.popleft()
+
+    def row(self):
+        done = len(self.correct_by_index)
+        (t0, r0, k0), (t1, r1, k1) = self.history[0], self.history[-1]
+        minutes = (t1 - t0) / 60
+        rpm = (r1 - r0) / minutes if minutes > 0 else 0.0
+        tpm = (k1 - k0) / minutes if minutes > 0 else 0.0
+        remaining = max(0, self.total - done)
+        return {
+            "shards": len(self.shards),
+            "done": done,
+            "total": self.total,
+            "requests_per_min": round(rpm, 1),
+            "tokens_per_min": round(tpm),
+            "error_rate": round(self.api_errors / self.attempts, 4) if self.attempts else 0.0,
+            "accuracy": round(sum(self.correct_by_index.values()) / done, 4) if done else None,
+            "eta_min": round(remaining / rpm, 1) if rpm > 0 else None,
+        }
+
+class RunMonitor:
+    # Tails every shard output/log of one run folder
+    def __init__(self, folder, prompts=None, total=14042):
+        self.folder = folder
+        self.prompts = set(prompts) if prompts else None
+        self.total = total
+        self.tails = {}
+        self.parquet_parts = set()
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def _stats(self, prompt):
+        if prompt not in self.stats:
+            self.stats[prompt] = PromptStats(self.total)
+        return self.stats[prompt]
+
+    def _tail(self, path):
+        if path not in self.tails:
+            self.tails[path] = FileTail(path)
+        return self.tails[path]
+
+    def _shard_files(self, pattern):
+        for path in glob(pattern):
+            match = SHARD_PATTERN.match(os.path.basename(path))
+            if match and not match["prompt"].endswith("_error_index") and (self.prompts is None or match["prompt"] in self.prompts):
+                yield path, match["prompt"], match["shard"]
+
+    def poll(self):
+        now = time.time()
+        with self.lock:
+            for path, prompt, shard in self._shard_files(f"temp/{self.folder}/*_shard*.json"):
+                stats = self._stats(prompt)
+                stats.shards.add(shard)
+                for line in self._tail(path).read_lines():
+                    try:
+                        stats.add_record(json.loads(line))
+                    except ValueError:
+                        continue
+            for path, prompt, shard in self._shard_files(f"temp/{self.folder}/*_shard*.parquet"):
+                # --results_format parquet: parts are immutable, so read each new one once
+                if os.path.exists(path.replace(".parquet", ".json")):
+                    continue
+                stats = self._stats(prompt)
+                stats.shards.add(shard)
+                for part in sorted(glob(os.path.join(path, "part-*.parquet"))):
+                    if part not in self.parquet_parts:
+                        self.parquet_parts.add(part)
+                        self._read_part(part, stats)
+            for path, prompt, shard in self._shard_files(f"log/{self.folder}/*_shard*.log"):
+                stats = self._stats(prompt)
+                for line in self._tail(path).read_lines():
+                    stats.add_log_line(line.decode("utf-8", errors="replace"))
+            for stats in self.stats.values():
+                stats.tick(now)
+
+    def _read_part(self, part, stats):
+        import pyarrow.parquet as pq
+        table = pq.read_table(part, columns=["index", "correct", "completion_tokens"])
+        for idx, correct, completion in zip(*(table.column(c).to_pylist() for c in table.column_names)):
+            stats.add_record({"index": idx, "correct": correct, "token_usage": {"completion": completion}})
+
+    def snapshot(self):
+        with self.lock:
+            rows = {prompt: stats.row() for prompt, stats in sorted(self.stats.items())}
+        overall = {
+            "shards": sum(r["shards"] for r in rows.values()),
+            "done": sum(r["done"] for r in rows.values()),
+            "total": sum(r["total"] for r in rows.values()),
+            "requests_per_min": round(sum(r["requests_per_min"] for r in rows.values()), 1),
+            "tokens_per_min": sum(r["tokens_per_min"] for r in rows.values()),
+        }
+        attempts = sum(s.attempts for s in self.stats.values())
+        overall["error_rate"] = round(sum(s.api_errors for s in self.stats.values()) / attempts, 4) if attempts else 0.0
+        answered = sum(len(s.correct_by_index) for s in self.stats.values())
+        overall["accuracy"] = round(sum(sum(s.correct_by_index.values()) for s in self.stats.values()) / answered, 4) if answered else None
+        remaining = overall["total"] - overall["done"]
+        overall["eta_min"] = round(remaining / overall["requests_per_min"], 1) if overall["requests_per_min"] > 0 else None
+        return {"folder": self.folder, "time": time.time(), "prompts": rows, "overall": overall}
+
+# === Rendering ===
+COLUMNS = ["shards", "done", "total", "requests_per_min", "tokens_per_min", "error_rate", "accuracy", "eta_min"]
+
+def format_table(snapshot):
+    rows = [("prompt", *COLUMNS)]
+    for name, row in list(snapshot["prompts"].items()) + [("ALL", snapshot["overall"])]:
+        rows.append((name, *("-" if row[c] is None else str(row[c]) for c in COLUMNS)))
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    lines = ["  ".join(cell.ljust(w) for cell, w in zip(r, widths)) for r in rows]
+    stamp = time.strftime("%H:%M:%S", time.localtime(snapshot["time"]))
+    return f"📊 Run {snapshot['folder']} @ {stamp}\n" + "\n".join(lines)
+
+def format_html(snapshot, refresh):
+    head = "".join(f"<th>{c}</th>" for c in ["prompt", *COLUMNS])
+    body = ""
+    for name, row in list(snapshot["prompts"].items()) + [("ALL", snapshot["overall"])]:
+        body += f"<tr><td>{name}</td>" + "".join(f"<td>{'-' if row[c] is None else row[c]}</td>" for c in COLUMNS) + "</tr>"
+    return (f"<html><head><meta http-equiv='refresh' content='{refresh}'><title>{snapshot['folder']}</title>"
+            "<style>body{font-family:monospace}td,th{padding:2px 10px;text-align:right}</style></head>"
+            f"<body><h3>Run {snapshot['folder']}</h3><table><tr>{head}</tr>{body}</table></body></html>")
+
+def serve(monitor, port, refresh):
+    # GET / -> auto-refreshing table, GET /data.json -> raw snapshot
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            snapshot = monitor.snapshot()
+            if self.path.startswith("/data.json"):
+                body, ctype = json.dumps(snapshot).encode("utf-8"), "application/json"
+            else:
+                body, ctype = format_html(snapshot, refresh).encode("utf-8"), "text/html; charset=utf-8"
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🌐 Dashboard at http://127.0.0.1:{port}/")
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live throughput/accuracy/ETA across all shards of a run.")
+    parser.add_argument("--folder", type=str, required=True, help="Run folder under temp/ and log/ (e.g. 20250430)")
+    parser.add_argument("--prompts", type=str, nargs="*", help="Only these prompts (default: all found)")
+    parser.add_argument("--total", type=int, default=14042, help="Items expected per prompt")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls")
+    parser.add_argument("--web", type=int, help="Also serve a small local web page on this port")
+    parser.add_argument("--once", action="store_true", help="Print one snapshot and exit")
+    args = parser.parse_args()
+
+    monitor = RunMonitor(args.folder, args.prompts, args.total)
+    monitor.poll()
+    if args.once:
+        print(format_table(monitor.snapshot()))
+    else:
+        if args.web:
+            serve(monitor, args.web, max(1, int(args.interval)))
+        try:
+            while True:
+                time.sleep(args.interval)
+                monitor.poll()
+                print("\033[2J\033[H" + format_table(monitor.snapshot()), flush=True)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,37 @@
+import os
+import numpy as np
+
+# Small per-index table of the MMLU test split (subject + answer), cached as .npz
+# so analysis never has to load the full dataset once the cache is warm. Checking
+# the dataset fingerprint would mean loading it, so invalidation is manual:
+# rebuild with `analyze.py --rebuild_index` after the dataset changes.
+INDEX_PATH = "cache/mmlu_index/mmlu_all_test.npz"
+
+def build_index(path=INDEX_PATH):
+    from datasets import load_dataset
+
+    test = load_dataset("cais/mmlu", "all")["test"]
+    columns = test.select_columns(["subject", "answer"]).to_dict()
+    subject_names, subject_codes = np.unique(np.array(columns["subject"]), return_inverse=True)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        subject_names=subject_names,
+        subject_codes=subject_codes.astype(np.uint16),
+        answers=np.array(columns["answer"], dtype=np.int8),
+    )
+    os.replace(tmp_path, path)
+    print(f"🗂️ Built MMLU index ({len(subject_codes)} rows) → {path}")
+
+def load_index(path=INDEX_PATH, rebuild=False):
+    if rebuild or not os.path.exists(path):
+        build_index(path)
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+def load_subject_map(path=INDEX_PATH, rebuild=False):
+    index = load_index(path, rebuild)
+    names = index["subject_names"][index["subject_codes"]].tolist()
+    return dict(enumerate(names))
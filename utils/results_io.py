@@ -0,0 +1,158 @@
+import json
+import os
+import re
+from datetime import datetime
+
+# Compact results format: one row per record with the numeric fields and the
+# response text. question/choices/prompt are left out - they are reproducible
+# from the dataset index and prompt_map.
+RESULTS_FORMATS = ["jsonl", "parquet", "both"]
+# (column, Arrow type, (nested record field, key) or None for top-level fields)
+RESULT_COLUMNS = [
+    ("index", "int32", None),
+    ("answer", "int8", None),
+    ("response_ans", "int8", None),
+    ("correct", "bool_", None),
+    ("time_usage", "float64", None),
+    ("prompt_tokens", "int32", ("token_usage", "prompt")),
+    ("completion_tokens", "int32", ("token_usage", "completion")),
+    ("total_tokens", "int32", ("token_usage", "total")),
+    ("ttft", "float64", ("timing", "ttft")),
+    ("time_to_answer", "float64", ("timing", "time_to_answer")),
+    ("stopped_early", "bool_", ("timing", "stopped_early")),
+    ("extraction_method", "string", None),
+    ("model", "string", None),
+    ("temperature", "float64", None),
+    ("request_key", "string", None),
+    ("response", "string", None),
+]
+
+def results_schema():
+    import pyarrow as pa
+    return pa.schema([(name, getattr(pa, kind)()) for name, kind, _ in RESULT_COLUMNS])
+
+def to_columns(records):
+    columns = {name: [] for name, _, _ in RESULT_COLUMNS}
+    for record in records:
+        for name, _, nested in RESULT_COLUMNS:
+            if nested:
+                columns[name].append((record.get(nested[0]) or {}).get(nested[1]))
+            else:
+                columns[name].append(record.get(name))
+    return columns
+
+def from_row(row):
+    # Same shape as a JSONL record (minus the text fields), so readers need no special case
+    record = {}
+    for name, _, nested in RESULT_COLUMNS:
+        if name not in row:
+            continue
+        if not nested:
+            record[name] = row[name]
+        elif row[name] is not None:
+            record.setdefault(nested[0], {})[nested[1]] = row[name]
+    return record
+
+def parquet_path(jsonl_path):
+    return os.path.splitext(jsonl_path)[0] + ".parquet"
+
+def is_parquet(path):
+    return path.endswith(".parquet")
+
+def find_results(folder, name):
+    # `{name}_output.parquet` when present, otherwise the JSONL `{name}_output.json`
+    for ext in (".parquet", ".json"):
+        path = os.path.join(folder, f"{name}{ext}")
+        if os.path.exists(path):
+            return path
+    return os.path.join(folder, f"{name}.json")
+
+def list_result_names(folder, suffix="_output"):
+    names = set()
+    for f in os.listdir(folder):
+        for ext in (".parquet", ".json"):
+            if f.endswith(suffix + ext):
+                names.add(f[:-len(suffix + ext)])
+    return sorted(names)
+
+def iter_records(path):
+    # Streams records from a JSONL file, a Parquet file or a directory of Parquet parts
+    if is_parquet(path):
+        import pyarrow.dataset as ds
+        # Explicit schema: parts written before a column was added read it as null
+        for batch in ds.dataset(path, format="parquet", schema=results_schema()).to_batches():
+            for row in batch.to_pylist():
+                yield from_row(row)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+INDEX_PREFIX = re.compile(r'^\{"index": (-?\d+)[,}]')
+
+def iter_indices(path):
+    # Just the index of every record, without decoding the rest of it
+    if is_parquet(path):
+        import pyarrow.dataset as ds
+        for batch in ds.dataset(path, format="parquet").to_batches(columns=["index"]):
+            yield from batch.column(0).to_pylist()
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            match = INDEX_PREFIX.match(line)
+            yield int(match.group(1)) if match else json.loads(line).get("index")
+
+def write_parquet(path, records):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(pa.table(to_columns(records), schema=results_schema()), tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+def write_records(path, records, batch_size=1000):
+    # Streams `records` into `path` (atomically), so memory stays bounded by one batch
+    if is_parquet(path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = results_schema()
+        tmp_path = path + ".tmp"
+        with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+            batch = []
+            for item in records:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    writer.write_table(pa.table(to_columns(batch), schema=schema))
+                    batch = []
+            if batch:
+                writer.write_table(pa.table(to_columns(batch), schema=schema))
+        os.replace(tmp_path, path)
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for item in records:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+class ParquetParts:
+    # Shard output as a directory of Parquet part files (Parquet cannot be appended
+    # to). Each run writes its own parts, named so later runs sort last.
+    def __init__(self, folder):
+        self.folder = folder
+        self.rows = []
+        self.stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        self.seq = 0
+
+    def add(self, record):
+        self.rows.append(record)
+
+    def take(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def write_part(self, rows):
+        if rows:
+            write_parquet(os.path.join(self.folder, f"part-{self.stamp}-{self.seq:05d}.parquet"), rows)
+            self.seq += 1
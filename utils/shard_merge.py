@@ -0,0 +1,100 @@
+import os
+import json
+import heapq
+import argparse
+import tempfile
+from itertools import groupby
+from results_io import iter_indices, iter_records, write_records
+
+# How to pick one record when several inputs hold the same index:
+#   latest     - the one from the last input (inputs are given oldest first)
+#   first      - the one from the first input
+#   successful - the latest one that has a response and a parsed answer, else the latest
+DUPLICATE_POLICIES = ["latest", "first", "successful"]
+
+def record_index(item):
+    return item.get("index", 0)
+
+def is_index_sorted(path):
+    previous = None
+    for idx in iter_indices(path):
+        idx = idx if idx is not None else 0
+        if previous is not None and idx < previous:
+            return False
+        previous = idx
+    return True
+
+def iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def sorted_runs(path, run_size, tmp_dir):
+    # Index-ordered iterator over one input. Inputs that are already ordered (the
+    # usual case for a sequential shard) stream straight through; otherwise the
+    # input is cut into sorted runs of `run_size` records spilled to `tmp_dir`
+    # and merged back, so memory stays bounded by one run.
+    if is_index_sorted(path):
+        return iter_records(path)
+    runs = []
+    batch = []
+    def spill():
+        fd, run_path = tempfile.mkstemp(prefix="run", suffix=".jsonl", dir=tmp_dir)
+        os.close(fd)
+        batch.sort(key=record_index)
+        write_records(run_path, batch)
+        runs.append(iter_jsonl(run_path))
+        batch.clear()
+    for item in iter_records(path):
+        batch.append(item)
+        if len(batch) >= run_size:
+            spill()
+    if not runs:
+        batch.sort(key=record_index)
+        return iter(batch)
+    if batch:
+        spill()
+    return heapq.merge(*runs, key=record_index)
+
+def is_successful(item):
+    return item.get("response") is not None and item.get("response_ans") is not None
+
+def pick(records, policy):
+    if policy == "first":
+        return records[0]
+    if policy == "successful":
+        successful = [item for item in records if is_successful(item)]
+        return (successful or records)[-1]
+    return records[-1]
+
+def merge_streams(paths, policy="latest", run_size=5000, tmp_dir=None):
+    # Yields one record per index, in index order. heapq.merge is stable, so equal
+    # indices come out in input order and, within an input, in file order.
+    if policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"❌ Unknown duplicate policy: {policy}")
+    streams = [sorted_runs(path, run_size, tmp_dir) for path in paths]
+    for _, group in groupby(heapq.merge(*streams, key=record_index), key=record_index):
+        yield pick(list(group), policy)
+
+def merge_files(paths, output_path, policy="latest", run_size=5000):
+    # Output format follows the extension of `output_path`; it may also be one of the inputs
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    counter = {"records": 0}
+    def counted(records):
+        for item in records:
+            counter["records"] += 1
+            yield item
+    with tempfile.TemporaryDirectory(prefix="shard_merge_") as tmp_dir:
+        write_records(output_path, counted(merge_streams(paths, policy, run_size, tmp_dir)))
+    return counter["records"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge result files (JSONL or Parquet) by index with bounded memory.")
+    parser.add_argument("--inputs", type=str, nargs="+", required=True, help="Result files, oldest first")
+    parser.add_argument("--output", type=str, required=True, help="Merged file (.json for JSONL, .parquet for Parquet)")
+    parser.add_argument("--policy", type=str, default="latest", choices=DUPLICATE_POLICIES)
+    parser.add_argument("--run_size", type=int, default=5000, help="Records per in-memory sorted run for unordered inputs")
+    args = parser.parse_args()
+
+    total = merge_files(args.inputs, args.output, args.policy, args.run_size)
+    print(f"✅ Merged {len(args.inputs)} files → {args.output} ({total} items)")